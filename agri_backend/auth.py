@@ -1,28 +1,51 @@
-import os
+import time
+import asyncio
+import hashlib
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from firebase_admin import auth, credentials, initialize_app
-import firebase_admin
+from firebase_admin import auth
+import firebase  # noqa: F401 - ensures Firebase Admin is initialized
 import logging
 from typing import Dict
 
 logger = logging.getLogger(__name__)
 
-# Initialize Firebase Admin SDK
-try:
-    #firebase_creds_path = os.getenv("FIREBASE_CREDENTIALS_PATH", "./firebase-credentials.json")
-    
-    if not firebase_admin._apps:
-        cred = credentials.Certificate("serviceAccountKey.json")
-        initialize_app(cred)
-        logger.info("✅ Firebase Admin initialized successfully")
-except Exception as e:
-    logger.error(f"❌ Firebase Admin initialization failed: {str(e)}")
-    logger.warning("⚠️  Firebase authentication may not work properly")
-
 # Security scheme
 security = HTTPBearer()
 
+# In-process cache of verified tokens
+# verify_id_token re-checks the JWT signature on every call, which dominates
+# auth latency. Cache decoded claims keyed by the token hash and trust them
+# until the token's own `exp` (with a small safety margin).
+_TOKEN_CACHE_MAXSIZE = 10_000
+_token_cache: Dict[bytes, Dict] = {}
+
+def _token_cache_key(token: str) -> bytes:
+    # blake2b is noticeably faster than sha256 here, and the key doesn't need
+    # cryptographic collision resistance - tokens are fully verified on miss
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+async def verify_id_token_cached(token: str) -> Dict:
+    """
+    Verify a Firebase ID token, reusing cached claims until they expire
+    Returns the full decoded token
+    """
+    key = _token_cache_key(token)
+    cached = _token_cache.get(key)
+    if cached and cached.get("exp", 0) > time.time() + 5:
+        return cached
+
+    # verify_id_token does blocking network + crypto work - run it in a
+    # thread so the event loop keeps serving other requests (cache misses only)
+    decoded_token = await asyncio.to_thread(auth.verify_id_token, token)
+
+    if len(_token_cache) >= _TOKEN_CACHE_MAXSIZE:
+        # Simple wholesale eviction - hot entries repopulate on next request
+        _token_cache.clear()
+    _token_cache[key] = decoded_token
+
+    return decoded_token
+
 async def verify_firebase_token(
     credentials: HTTPAuthorizationCredentials = Security(security)
 ) -> Dict:
@@ -30,19 +53,16 @@ async def verify_firebase_token(
     Verify Firebase ID token from Authorization header
     Returns decoded token with user info
     """
-    if not credentials:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing authentication credentials"
-        )
-    
+    # HTTPBearer(auto_error=True) already rejects requests without
+    # credentials, so no missing-credentials branch is needed here
     token = credentials.credentials
-    
+
+
     try:
-        # Verify the ID token
-        decoded_token = auth.verify_id_token(token)
-        
-        logger.info(f"✅ Token verified for user: {decoded_token.get('uid')}")
+        # Verify the ID token (cached after first verification)
+        decoded_token = await verify_id_token_cached(token)
+
+        logger.info("✅ Token verified for user: %s", decoded_token.get('uid'))
         
         return {
             "uid": decoded_token.get("uid"),
@@ -63,16 +83,13 @@ async def verify_firebase_token(
             detail="Authentication token has expired"
         )
     except Exception as e:
-        logger.error(f"❌ Token verification failed: {str(e)}")
+        logger.error("❌ Token verification failed: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Authentication failed: {str(e)}"
         )
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Security(security)
-) -> Dict:
-    """
-    Alias for verify_firebase_token for backward compatibility
-    """
-    return await verify_firebase_token(credentials)
+# Alias for backward compatibility - a direct reference (rather than a
+# wrapper) lets FastAPI's dependency cache dedupe the two names within a
+# single request
+get_current_user = verify_firebase_token
@@ -1,4 +1,8 @@
 # database.py - Simple MongoDB connection
+# Motor (async) is deliberate: endpoints are await-only around single
+# roundtrips, CPU-heavy work (Firebase verify, image decode) runs in the
+# threadpool, and uvloop handles the loop - so the async driver wins over a
+# sync driver + threadpool conversion.
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
@@ -6,8 +10,20 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # MongoDB connection
+# Pool tuning: maxPoolSize bounds sockets under burst, minPoolSize keeps warm
+# connections for steady traffic, and the wait/selection timeouts make
+# overload fail fast instead of queueing indefinitely. maxPoolSize is a
+# per-process budget - multiply by uvicorn workers when sizing Mongo's
+# connection limit (50 x 4 workers = 200 server-side).
 MONGO_URL = os.getenv("MONGO_URI")
-client = AsyncIOMotorClient(MONGO_URL)
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=50,
+    minPoolSize=5,
+    waitQueueTimeoutMS=5000,
+    serverSelectionTimeoutMS=3000,
+    retryWrites=True
+)
 db = client.agri_app
 
 # Collections
@@ -23,6 +39,15 @@ def check_db_connection():
         client.admin.command('ping')
         print("✅ MongoDB connected successfully")
         return True
+    except Exception as e:
+        print(f"❌ MongoDB connection failed: {e}")
+        return False
+
+async def check_db_connection_async():
+    """Ping MongoDB without blocking the event loop"""
+    try:
+        await client.admin.command('ping')
+        return True
     except Exception as e:
         print(f"❌ MongoDB connection failed: {e}")
         return False
\ No newline at end of file
@@ -1,5 +1,19 @@
+# firebase.py - single Firebase Admin initialization point
+# Import this module (once, before any router that uses firebase_admin.auth)
+# instead of re-initializing in every module - the JSON + RSA key parse is
+# not free and init order should not depend on import order.
+import logging
+
 import firebase_admin
 from firebase_admin import credentials
 
-cred = credentials.Certificate("serviceAccountKey.json")
-firebase_admin.initialize_app(cred)
+logger = logging.getLogger(__name__)
+
+try:
+    if not firebase_admin._apps:
+        cred = credentials.Certificate("serviceAccountKey.json")
+        firebase_admin.initialize_app(cred)
+        logger.info("✅ Firebase Admin initialized successfully")
+except Exception as e:
+    logger.error("❌ Firebase Admin initialization failed: %s", str(e))
+    logger.warning("⚠️  Firebase authentication may not work properly")
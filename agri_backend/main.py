@@ -1,6 +1,7 @@
 # main.py - Simple FastAPI app
 import logging
 import sys
+import time
 
 # -----------------------------
 # Logging setup - MUST be first
@@ -13,31 +14,39 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.info("💡 Logger initialized successfully")
 
+# -----------------------------
+# Event loop - use uvloop when available (2-4x faster on I/O-bound loads)
+# -----------------------------
+import asyncio
+
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("⚡ uvloop event loop policy installed")
+except ImportError:
+    logger.info("uvloop not installed - using default asyncio event loop")
+
+# -----------------------------
+# Firebase Admin initialization
+# -----------------------------
+# Must happen before any router that uses firebase_admin.auth is imported
+import firebase  # noqa: F401
+
 # -----------------------------
 # FastAPI & imports
 # -----------------------------
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from routes.auth_routes import router as auth_router
 from routes.user_routes import router as user_router
 from routes.recommendation_routes import router as recommendation_router
 from routes.maintenance import router as maintenance_router
-from database import check_db_connection
+from database import check_db_connection_async, db
 from routes.assistant_routes import router as assistant_router
-
-# -----------------------------
-# Firebase Admin initialization
-# -----------------------------
-try:
-    import firebase_admin
-    from firebase_admin import credentials
-
-    if not firebase_admin._apps:
-        cred = credentials.Certificate("serviceAccountKey.json")
-        firebase_admin.initialize_app(cred)
-        logger.info("✅ Firebase Admin initialized successfully")
-except Exception as e:
-    logger.error(f"❌ Firebase Admin initialization failed: {str(e)}")
+from slowapi import _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from rate_limit import limiter
 
 # -----------------------------
 # FastAPI app
@@ -45,9 +54,16 @@ except Exception as e:
 app = FastAPI(
     title="Agri Decision Support API",
     description="Simple API for agricultural decision support system",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # C-speed JSON encoding
 )
 
+# -----------------------------
+# Rate limiting
+# -----------------------------
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
 # -----------------------------
 # CORS middleware
 # -----------------------------
@@ -55,8 +71,9 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],  # React frontend
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],  # only what the routes use
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=3600,  # let browsers cache preflight responses for an hour
 )
 
 # -----------------------------
@@ -73,12 +90,34 @@ app.include_router(assistant_router)
 # -----------------------------
 @app.on_event("startup")
 async def startup_event():
-    """Check database connection on startup"""
-    if check_db_connection():
+    """Check database connection and ensure indexes on startup"""
+    if await check_db_connection_async():
         logger.info("✅ MongoDB connected successfully")
     else:
         logger.error("❌ MongoDB connection failed")
 
+    # Indexes for the hot lookup paths - without these, uid/email lookups and
+    # the chat-history sort are full collection scans
+    try:
+        await db.users.create_index("uid", unique=True)
+        await db.users.create_index("email", unique=True)
+        await db.chat_history.create_index([("user_id", 1), ("timestamp", -1)])
+        await db.cache.create_index("key", unique=True)
+        # TTL index - Mongo purges expired cache entries itself
+        await db.cache.create_index("expires_at", expireAfterSeconds=0)
+        await db.feedback.create_index([("uid", 1), ("timestamp", -1)])
+        logger.info("✅ MongoDB indexes ensured")
+    except Exception as e:
+        logger.error("❌ Failed to create MongoDB indexes: %s", str(e))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared clients on shutdown"""
+    from services.bhuvan_api import bhuvan_service
+    from services.gemini_service import gemini_service, SEMANTIC_CACHE_PATH
+    await bhuvan_service.aclose()
+    gemini_service.semantic_cache.save(SEMANTIC_CACHE_PATH)
+
 # -----------------------------
 # Endpoints
 # -----------------------------
@@ -92,11 +131,21 @@ async def root():
         "version": "1.0.0"
     }
 
+# Health probes fire every few seconds - cache the DB ping result briefly
+# instead of paying a Mongo roundtrip per probe
+_HEALTH_CACHE_TTL = 5.0  # seconds
+_health_cache = {"db_ok": False, "checked_at": 0.0}
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    db_status = "connected" if check_db_connection() else "disconnected"
-    logger.info(f"🩺 Health check called - DB: {db_status}")
+    """Health check endpoint (DB ping cached for a few seconds)"""
+    now = time.monotonic()
+    if now - _health_cache["checked_at"] >= _HEALTH_CACHE_TTL:
+        _health_cache["db_ok"] = await check_db_connection_async()
+        _health_cache["checked_at"] = now
+
+    db_status = "connected" if _health_cache["db_ok"] else "disconnected"
+    logger.info("🩺 Health check called - DB: %s", db_status)
     return {
         "status": "healthy",
         "database": db_status
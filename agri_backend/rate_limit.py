@@ -0,0 +1,12 @@
+# rate_limit.py - shared slowapi limiter
+# Keyed by the uid path parameter where present so one user looping an
+# endpoint can't saturate external API quotas; falls back to client IP.
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+
+def uid_or_ip(request):
+    return request.path_params.get("uid") or get_remote_address(request)
+
+
+limiter = Limiter(key_func=uid_or_ip)
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from pydantic import BaseModel
+import asyncio
 import logging
-import json
+import orjson
 
 from services.gemini_service import gemini_service
 from auth import get_current_user
-from models.user import User
 from database import get_database
 
 logger = logging.getLogger(__name__)
@@ -24,12 +25,136 @@ class ChatResponse(BaseModel):
     metadata: dict
     status: str
 
+# Static payloads - built once at import instead of per request
+SUGGESTIONS = {
+    "crop": [
+        "What crops should I grow this season?",
+        "Best crops for my soil type",
+        "High profit crops for small farms",
+        "Crops with low water requirement"
+    ],
+    "disease": [
+        "How to identify crop diseases?",
+        "Common pests in my region",
+        "Organic pest control methods",
+        "When to spray pesticides?"
+    ],
+    "weather": [
+        "What is the weather forecast?",
+        "When will it rain next?",
+        "Best time for harvesting?",
+        "How to prepare for monsoon?"
+    ],
+    "market": [
+        "What are current market prices?",
+        "When should I sell my crops?",
+        "Which crops have high demand?",
+        "How to get better prices?"
+    ],
+    "irrigation": [
+        "How much water do my crops need?",
+        "What is drip irrigation?",
+        "How to save water?",
+        "When should I irrigate?"
+    ],
+    "general": [
+        "What crops should I grow?",
+        "How is the weather?",
+        "Show market prices",
+        "Identify this disease (upload image)",
+        "Best fertilizer for my crop",
+        "How to improve soil health?"
+    ]
+}
+
+# Static part of the image-analysis prompt - built once, the optional
+# farmer description is appended per request
+ANALYSIS_PROMPT = """Analyze this crop/plant image and provide:
+
+1. **Plant/Crop Identification:**
+   - What plant/crop is this?
+   - Growth stage
+
+2. **Health Assessment:**
+   - Overall health status
+   - Any visible issues
+
+3. **Disease/Pest Detection:**
+   - Identify any diseases or pests
+   - Severity level (Mild/Moderate/Severe)
+
+4. **Treatment Recommendations:**
+   - Immediate actions needed
+   - Recommended treatments (preferably organic)
+   - Estimated costs in INR
+
+5. **Prevention Tips:**
+   - How to prevent this in future
+   - Best practices
+
+Please be specific and practical for Indian farmers."""
+
+LANGUAGE_MAP = {
+    'en-IN': 'en',
+    'hi-IN': 'hi',
+    'ta-IN': 'ta',
+    'te-IN': 'te',
+    'bn-IN': 'bn',
+    'mr-IN': 'mr',
+    'gu-IN': 'gu'
+}
+
+# Bound per-upload memory: crop photos from phones can be several MB
+MAX_IMAGE_BYTES = 10 * 1024 * 1024  # 10 MB
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+async def _store_chat_record(db, chat_record: dict):
+    """Persist a chat record in the background, logging failures"""
+    try:
+        await db.chat_history.insert_one(chat_record)
+    except Exception as e:
+        logger.error("Failed to store chat history: %s", e)
+
+# The event loop only keeps weak references to tasks - a bare
+# create_task can be garbage-collected before it runs, silently dropping
+# the history write. Hold a strong reference until the task finishes.
+_background_tasks = set()
+
+def _spawn_store_task(db, chat_record: dict):
+    task = asyncio.create_task(_store_chat_record(db, chat_record))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def read_image_upload(image: UploadFile) -> bytes:
+    """
+    Read an uploaded image in chunks with an early size cap, instead of
+    buffering an unbounded body in one read
+    """
+    if image.content_type and not image.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported upload type: {image.content_type}"
+        )
+
+    chunks = []
+    total = 0
+    while chunk := await image.read(IMAGE_CHUNK_SIZE):
+        total += len(chunk)
+        if total > MAX_IMAGE_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image too large (max {MAX_IMAGE_BYTES // (1024 * 1024)} MB)"
+            )
+        chunks.append(chunk)
+
+    return b"".join(chunks)
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_assistant(
     message: str = Form(...),
     user_context: str = Form(None),
     image: Optional[UploadFile] = File(None),
-    #current_user: User = Depends(get_current_user),
+    #current_user: dict = Depends(get_current_user),
     db = Depends(get_database)
 ):
     """
@@ -41,18 +166,18 @@ async def chat_with_assistant(
         context = None
         if user_context:
             try:
-                context = json.loads(user_context)
+                context = orjson.loads(user_context)
             except:
                 logger.warning("Failed to parse user_context")
         
         # Read image if provided
         image_bytes = None
         if image:
-            image_bytes = await image.read()
-            logger.info(f"Received image: {image.filename}, size: {len(image_bytes)} bytes")
+            image_bytes = await read_image_upload(image)
+            logger.info("Received image: %s, size: %s bytes", image.filename, len(image_bytes))
         
         # Generate AI response
-        result = gemini_service.generate_response(
+        result = await gemini_service.generate_response(
             message=message,
             user_context=context,
             image=image_bytes
@@ -69,11 +194,10 @@ async def chat_with_assistant(
             "timestamp": None  # Will be set by database
         }
         
-        try:
-            await db.chat_history.insert_one(chat_record)
-        except Exception as e:
-            logger.error(f"Failed to store chat history: {e}")
-        
+        # Not on the critical path - persist in the background so the
+        # response doesn't wait on a Mongo roundtrip
+        _spawn_store_task(db, chat_record)
+
         return ChatResponse(
             response=result["response"],
             suggestions=result.get("suggestions", []),
@@ -81,49 +205,105 @@ async def chat_with_assistant(
             status=result.get("status", "success")
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Chat error: {str(e)}")
+        logger.error("Chat error: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Failed to process chat request: {str(e)}"
         )
 
+@router.post("/chat/stream")
+async def chat_with_assistant_stream(
+    message: str = Form(...),
+    user_context: str = Form(None),
+    image: Optional[UploadFile] = File(None),
+    db = Depends(get_database)
+):
+    """
+    Chat with AI assistant, streamed as Server-Sent Events - tokens reach
+    the client as Gemini produces them instead of after full generation
+    """
+    context = None
+    if user_context:
+        try:
+            context = orjson.loads(user_context)
+        except:
+            logger.warning("Failed to parse user_context")
+
+    image_bytes = None
+    if image:
+        image_bytes = await read_image_upload(image)
+
+    async def event_stream():
+        parts = []
+        result = {}
+        try:
+            async for event in gemini_service.generate_response_stream(
+                message=message,
+                user_context=context,
+                image=image_bytes
+            ):
+                if event.get("type") == "chunk":
+                    parts.append(event.get("text", ""))
+                else:
+                    result = event
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+        except Exception as e:
+            logger.error("Chat stream error: %s", str(e))
+            yield b"data: " + orjson.dumps(
+                {"type": "error", "detail": "Failed to stream response"}
+            ) + b"\n\n"
+            return
+
+        chat_record = {
+            "user_id": "test",
+            "message": message,
+            "response": "".join(parts),
+            "has_image": image_bytes is not None,
+            "suggestions": result.get("suggestions", []),
+            "metadata": result.get("metadata", {}),
+            "timestamp": None  # Will be set by database
+        }
+        _spawn_store_task(db, chat_record)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @router.get("/chat/history")
 async def get_chat_history(
     limit: int = 20,
-    current_user: User = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user),
     db = Depends(get_database)
 ):
     """
-    Get user's chat history
+    Get user's chat history (streamed - documents are serialized as the
+    cursor yields them instead of materializing the whole list in memory)
     """
-    try:
-        cursor = db.chat_history.find(
-            {"user_id": str(current_user.id)}
-        ).sort("timestamp", -1).limit(limit)
-        
-        history = await cursor.to_list(length=limit)
-        
-        # Convert ObjectId to string
-        for item in history:
-            item["id"] = str(item.pop("_id"))
-        
-        return {
-            "status": "success",
-            "data": history,
-            "count": len(history)
-        }
-        
-    except Exception as e:
-        logger.error(f"Error fetching chat history: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to fetch chat history"
-        )
+    cursor = db.chat_history.find(
+        {"user_id": current_user["uid"]},
+        {"_id": 0, "message": 1, "response": 1, "suggestions": 1,
+         "metadata": 1, "timestamp": 1, "has_image": 1}
+    ).sort("timestamp", -1).limit(limit)
+
+    async def stream_history():
+        yield b'{"status": "success", "data": ['
+        count = 0
+        try:
+            async for item in cursor:
+                if count:
+                    yield b","
+                yield orjson.dumps(item)
+                count += 1
+        except Exception as e:
+            logger.error("Error streaming chat history: %s", str(e))
+        yield b'], "count": %d}' % count
+
+    return StreamingResponse(stream_history(), media_type="application/json")
 
 @router.delete("/chat/history")
 async def clear_chat_history(
-    current_user: User = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user),
     db = Depends(get_database)
 ):
     """
@@ -131,7 +311,7 @@ async def clear_chat_history(
     """
     try:
         result = await db.chat_history.delete_many(
-            {"user_id": str(current_user.id)}
+            {"user_id": current_user["uid"]}
         )
         
         return {
@@ -140,7 +320,7 @@ async def clear_chat_history(
         }
         
     except Exception as e:
-        logger.error(f"Error clearing chat history: {str(e)}")
+        logger.error("Error clearing chat history: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail="Failed to clear chat history"
@@ -150,46 +330,21 @@ async def clear_chat_history(
 async def analyze_crop_image(
     image: UploadFile = File(...),
     description: Optional[str] = Form(None),
-    current_user: User = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user)
 ):
     """
     Analyze crop/plant image for disease detection
     """
     try:
         # Read image
-        image_bytes = await image.read()
-        
-        # Prepare prompt for image analysis
-        analysis_prompt = """Analyze this crop/plant image and provide:
-
-1. **Plant/Crop Identification:**
-   - What plant/crop is this?
-   - Growth stage
-
-2. **Health Assessment:**
-   - Overall health status
-   - Any visible issues
-
-3. **Disease/Pest Detection:**
-   - Identify any diseases or pests
-   - Severity level (Mild/Moderate/Severe)
-
-4. **Treatment Recommendations:**
-   - Immediate actions needed
-   - Recommended treatments (preferably organic)
-   - Estimated costs in INR
-
-5. **Prevention Tips:**
-   - How to prevent this in future
-   - Best practices
-
-Please be specific and practical for Indian farmers."""
+        image_bytes = await read_image_upload(image)
 
+        analysis_prompt = ANALYSIS_PROMPT
         if description:
-            analysis_prompt += f"\n\nFarmer's description: {description}"
-        
+            analysis_prompt = f"{ANALYSIS_PROMPT}\n\nFarmer's description: {description}"
+
         # Generate AI analysis
-        result = gemini_service.generate_response(
+        result = await gemini_service.generate_response(
             message=analysis_prompt,
             image=image_bytes
         )
@@ -201,8 +356,10 @@ Please be specific and practical for Indian farmers."""
             "metadata": result.get("metadata", {})
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Image analysis error: {str(e)}")
+        logger.error("Image analysis error: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Failed to analyze image: {str(e)}"
@@ -211,66 +368,70 @@ Please be specific and practical for Indian farmers."""
 @router.get("/suggestions")
 async def get_quick_suggestions(
     category: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user)
 ):
     """
     Get quick suggestion prompts for users
     """
-    suggestions = {
-        "crop": [
-            "What crops should I grow this season?",
-            "Best crops for my soil type",
-            "High profit crops for small farms",
-            "Crops with low water requirement"
-        ],
-        "disease": [
-            "How to identify crop diseases?",
-            "Common pests in my region",
-            "Organic pest control methods",
-            "When to spray pesticides?"
-        ],
-        "weather": [
-            "What is the weather forecast?",
-            "When will it rain next?",
-            "Best time for harvesting?",
-            "How to prepare for monsoon?"
-        ],
-        "market": [
-            "What are current market prices?",
-            "When should I sell my crops?",
-            "Which crops have high demand?",
-            "How to get better prices?"
-        ],
-        "irrigation": [
-            "How much water do my crops need?",
-            "What is drip irrigation?",
-            "How to save water?",
-            "When should I irrigate?"
-        ],
-        "general": [
-            "What crops should I grow?",
-            "How is the weather?",
-            "Show market prices",
-            "Identify this disease (upload image)",
-            "Best fertilizer for my crop",
-            "How to improve soil health?"
-        ]
-    }
-    
-    if category and category in suggestions:
+    if category and category in SUGGESTIONS:
         return {
             "status": "success",
             "category": category,
-            "suggestions": suggestions[category]
+            "suggestions": SUGGESTIONS[category]
         }
-    
+
     return {
         "status": "success",
-        "suggestions": suggestions
+        "suggestions": SUGGESTIONS
     }
 
 
 
+class BatchChatItem(BaseModel):
+    message: str
+    user_context: Optional[dict] = None
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem]
+
+# Batch jobs are throughput-bound - cap the payload, not the QPS
+MAX_BATCH_ITEMS = 1000
+
+@router.post("/batch")
+async def batch_chat(
+    req: BatchChatRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Generate responses for many prompts with bounded concurrent fan-out
+    (for non-interactive work like nightly advisory generation)
+    """
+    if not req.items:
+        raise HTTPException(status_code=400, detail="No items to process")
+    if len(req.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many items (max {MAX_BATCH_ITEMS})"
+        )
+
+    try:
+        results = await gemini_service.generate_batch(
+            [item.model_dump() for item in req.items]
+        )
+        return {
+            "status": "success",
+            "count": len(results),
+            "results": results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Batch generation error: %s", str(e))
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process batch request"
+        )
+
 class TranslateRequest(BaseModel):
     text: str
     target_language: str
@@ -281,17 +442,7 @@ async def translate_text(req: TranslateRequest):
     Translate text to target language using Google Translate API or Gemini
     """
     try:
-        language_map = {
-            'en-IN': 'en',
-            'hi-IN': 'hi',
-            'ta-IN': 'ta',
-            'te-IN': 'te',
-            'bn-IN': 'bn',
-            'mr-IN': 'mr',
-            'gu-IN': 'gu'
-        }
-        
-        target_lang_code = language_map.get(req.target_language, 'en')
+        target_lang_code = LANGUAGE_MAP.get(req.target_language, 'en')
         
         translation_prompt = f"""Translate the following text to {target_lang_code} language. 
 Only provide the translation, no explanations:
@@ -300,7 +451,7 @@ Text: {req.text}
 
 Translation:"""
         
-        result = gemini_service.generate_response(
+        result = await gemini_service.generate_response(
             message=translation_prompt,
             user_context=None
         )
@@ -315,7 +466,7 @@ Translation:"""
         }
         
     except Exception as e:
-        logger.error(f"Translation error: {str(e)}")
+        logger.error("Translation error: %s", str(e))
         return {
             "status": "error",
             "original_text": req.text,
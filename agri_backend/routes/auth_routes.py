@@ -4,6 +4,8 @@ from models.user import UserResponse, LoginRequest, SignupRequest
 from database import get_database
 from datetime import datetime
 from firebase_admin import auth
+from pymongo.errors import DuplicateKeyError
+from auth import verify_id_token_cached
 import logging
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -12,7 +14,7 @@ logger = logging.getLogger(__name__)
 # Helper function for signup/login
 async def decode_firebase_token(id_token: str):
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = await verify_id_token_cached(id_token)
         return {
             "success": True,
             "uid": decoded_token.get("uid"),
@@ -20,7 +22,7 @@ async def decode_firebase_token(id_token: str):
             "email_verified": decoded_token.get("email_verified", False)
         }
     except Exception as e:
-        logger.error(f"❌ Token decode failed: {str(e)}")
+        logger.error("❌ Token decode failed: %s", str(e))
         return {"success": False, "error": str(e)}
 
 
@@ -36,15 +38,6 @@ async def signup(signup_data: SignupRequest, db=Depends(get_database)):
     uid = token_result["uid"]
     email = token_result["email"]
 
-    # Check if UID already exists
-    existing_user = await db.users.find_one({"uid": uid})
-    if existing_user:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
-
-    # Optional: enforce unique email
-    if await db.users.find_one({"email": email}):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already in use")
-
     # Create new user
     user_data = {
         "uid": uid,
@@ -58,13 +51,21 @@ async def signup(signup_data: SignupRequest, db=Depends(get_database)):
         "is_active": True
     }
 
-    await db.users.insert_one(user_data)
-    logger.info(f"✅ New user created: {uid}")
+    # Single roundtrip: the unique indexes on uid/email enforce both
+    # existence checks atomically
+    try:
+        await db.users.insert_one(user_data)
+    except DuplicateKeyError as e:
+        key_pattern = (e.details or {}).get("keyPattern", {})
+        detail = "Email already in use" if "email" in key_pattern else "User already exists"
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+    logger.info("✅ New user created: %s", uid)
 
     return {
         "success": True,
         "message": "User created successfully",
-        "user": UserResponse(**user_data)
+        "user": UserResponse.model_construct(**user_data)
     }
 
 
@@ -87,12 +88,12 @@ async def login(login_data: LoginRequest, db=Depends(get_database)):
             detail="User not found. Please signup first."
         )
 
-    logger.info(f"✅ Login successful for user: {uid}")
+    logger.info("✅ Login successful for user: %s", uid)
 
     return {
         "success": True,
         "message": "Login successful",
-        "user": UserResponse(**user)
+        "user": UserResponse.model_construct(**user)
     }
 @router.post("/logout")
 async def logout(): 
@@ -1,38 +1,65 @@
 # routes/maintenance.py
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
 from database import users_collection
-from models.user import UserResponse
 from firebase_admin import auth
 router = APIRouter(tags=["Maintenance"])
 
-# Get all users
+# Fetch only the fields UserResponse actually exposes - skips decoding the
+# rest of the document (crop_history etc.) on the server and the wire
+USER_RESPONSE_PROJECTION = {
+    "_id": 0,
+    "uid": 1,
+    "email": 1,
+    "name": 1,
+    "phone": 1,
+    "location": 1,
+    "farm_size": 1,
+    "role": 1,
+    "language": 1,
+    "preferred_contact": 1,
+    "created_at": 1,
+    "updated_at": 1
+}
+
+# Get all users (paginated - an unbounded scan becomes a memory spike as
+# the collection grows)
 @router.get("/all-users")
-def get_all_users():
-    users_cursor = users_collection.find({})
-    users = []
-    for user in users_cursor:
-        user.pop("_id", None)  # remove MongoDB _id
-        users.append(UserResponse(**user))
-    return {"users": users}
+async def get_all_users(
+    limit: int = Query(100, ge=1, le=1000),
+    skip: int = Query(0, ge=0)
+):
+    # Projection already shapes the documents - hand them to the JSON
+    # encoder as-is, no per-document model construction
+    users = await users_collection.find(
+        {}, USER_RESPONSE_PROJECTION
+    ).skip(skip).limit(limit).to_list(length=limit)
+    return {"users": users, "skip": skip, "limit": limit}
 
-# Delete all users
+# Delete all users (requires explicit confirmation)
 @router.delete("/delete-all-users")
-def delete_all_users():
-    result = users_collection.delete_many({})
+async def delete_all_users(confirm: bool = Query(False)):
+    if not confirm:
+        raise HTTPException(
+            status_code=400,
+            detail="Pass confirm=true to delete all users"
+        )
+    result = await users_collection.delete_many({})
     return {"deleted_count": result.deleted_count}
 
 # Delete single user by UID
 @router.delete("/delete-user/{uid}")
-def delete_user(uid: str):
-    result = users_collection.delete_one({"uid": uid})
+async def delete_user(uid: str):
+    result = await users_collection.delete_one({"uid": uid})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     return {"deleted_count": result.deleted_count}
 
 @router.get("/all-firebase-users")
-def get_all_users():
+async def get_all_firebase_users():
     users_list = []
-    page = auth.list_users()
+    # Firebase Admin is sync - run it off the event loop
+    page = await asyncio.to_thread(auth.list_users)
     for user in page.users:
         users_list.append({
             "uid": user.uid,
@@ -43,9 +70,9 @@ def get_all_users():
     return {"users": users_list}
 
 @router.delete("/delete-firebase-user/{uid}")
-def delete_user(uid: str):
+async def delete_firebase_user(uid: str):
     try:
-        auth.delete_user(uid)
+        await asyncio.to_thread(auth.delete_user, uid)
         return {"success": True, "message": f"User {uid} deleted successfully"}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, status, Query, Request
+from fastapi.responses import ORJSONResponse
+from rate_limit import limiter
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import Optional
 import logging
+import time
 from datetime import datetime
 
 from database import get_database
@@ -13,9 +16,39 @@ from services.recommender import recommender_service
 router = APIRouter(prefix="/recommendations", tags=["Crop Recommendations"])
 logger = logging.getLogger(__name__)
 
+def _reco_cache_key(uid: str) -> str:
+    """Cache key for a user's recommendations - one definition for all handlers"""
+    return f"recommendations_{uid}"
+
+async def _cache_write(db, cache_key: str, data: dict):
+    """Upsert a recommendation payload into the cache (runs after response)"""
+    try:
+        from datetime import timedelta
+        await db.cache.update_one(
+            {"key": cache_key},
+            {
+                "$set": {
+                    "key": cache_key,
+                    "data": data,
+                    # Integer epoch for the read-path comparison (cheap to
+                    # compare, no datetime allocation per read)
+                    "expires_at_epoch": int(time.time()) + 86400,
+                    # Datetime kept for Mongo's TTL purge of stale entries
+                    "expires_at": datetime.utcnow() + timedelta(hours=24),
+                    "updated_at": datetime.utcnow()
+                }
+            },
+            upsert=True
+        )
+    except Exception as e:
+        logger.error("Failed to write recommendation cache: %s", str(e))
+
 @router.get("/{uid}", response_model=RecommendationResponse)
+@limiter.limit("10/minute")  # caps the external API fan-out per user
 async def get_recommendations(
+    request: Request,
     uid: str,
+    background_tasks: BackgroundTasks,
     force_refresh: bool = Query(False, description="Force fresh API calls"),
     top_n: int = Query(5, ge=1, le=10, description="Number of recommendations"),
     db: AsyncIOMotorDatabase = Depends(get_database),
@@ -39,8 +72,13 @@ async def get_recommendations(
         )
     
     try:
-        # 1. Fetch user profile
-        user = await db.users.find_one({"uid": uid})
+        # 1. Fetch user profile - only the fields used below; $slice trims
+        # crop_history to the last 5 entries server-side
+        user = await db.users.find_one(
+            {"uid": uid},
+            {"_id": 0, "village": 1, "state": 1, "language": 1,
+             "crop_history": {"$slice": -5}}
+        )
         
         if not user:
             raise HTTPException(
@@ -59,17 +97,24 @@ async def get_recommendations(
                 detail="User profile missing village or state information"
             )
         
-        logger.info(f"Generating recommendations for {uid} - {village}, {state}")
+        logger.info("Generating recommendations for %s - %s, %s", uid, village, state)
         
         # 2. Check cache first (unless force_refresh)
-        cache_key = f"recommendations_{uid}"
+        cache_key = _reco_cache_key(uid)
         if not force_refresh:
-            cached = await db.cache.find_one({"key": cache_key})
-            if cached and cached.get("expires_at") > datetime.utcnow():
-                logger.info(f"Returning cached recommendations for {uid}")
+            # Expiry is filtered server-side (indexed), so expired docs are
+            # never decoded here; only the payload field is fetched
+            cached = await db.cache.find_one(
+                {"key": cache_key, "expires_at_epoch": {"$gt": int(time.time())}},
+                {"data": 1}
+            )
+            if cached:
+                logger.info("Returning cached recommendations for %s", uid)
                 cached_data = cached.get("data")
                 cached_data["from_cache"] = True
-                return cached_data
+                # The payload was validated when it was generated - encode it
+                # straight to JSON instead of re-validating through Pydantic
+                return ORJSONResponse(cached_data)
         
         # 3. Get geocode from Bhuvan
         geocode = await bhuvan_service.get_village_geocode(village, state)
@@ -83,7 +128,7 @@ async def get_recommendations(
         lat = geocode["lat"]
         lon = geocode["lon"]
         
-        logger.info(f"Geocode retrieved: {lat}, {lon}")
+        logger.info("Geocode retrieved: %s, %s", lat, lon)
         
         # 4. Get soil properties
         soil_info = await bhuvan_service.get_soil_properties(lat, lon)
@@ -94,10 +139,10 @@ async def get_recommendations(
                 detail="Unable to fetch soil data. Please try again later."
             )
         
-        logger.info(f"Soil info retrieved: {soil_info.get('soil_type')}, pH: {soil_info.get('ph')}")
+        logger.info("Soil info retrieved: %s, pH: %s", soil_info.get('soil_type'), soil_info.get('ph'))
         
-        # 5. Extract previous crops from history
-        prev_crops = [entry.get("crop_name") for entry in crop_history[-5:]]
+        # 5. Extract previous crops (history already sliced to the last 5)
+        prev_crops = [entry.get("crop_name") for entry in crop_history]
         
         # 6. Generate recommendations
         recommendations = recommender_service.get_recommendations(
@@ -131,29 +176,20 @@ async def get_recommendations(
             timestamp=datetime.utcnow()
         )
         
-        # 9. Cache the result (valid for 24 hours)
-        from datetime import timedelta
-        await db.cache.update_one(
-            {"key": cache_key},
-            {
-                "$set": {
-                    "key": cache_key,
-                    "data": response_data.dict(),
-                    "expires_at": datetime.utcnow() + timedelta(hours=24),
-                    "updated_at": datetime.utcnow()
-                }
-            },
-            upsert=True
-        )
-        
-        logger.info(f"Successfully generated {len(recommendations)} recommendations for {uid}")
-        
-        return response_data
+        # 9. Serialize once - the same JSON-shaped dict goes to the cache
+        # (valid for 24 hours, written after the response is sent) and
+        # straight onto the wire, with no second Pydantic walk
+        payload = response_data.model_dump(mode="json")
+        background_tasks.add_task(_cache_write, db, cache_key, payload)
+
+        logger.info("Successfully generated %s recommendations for %s", len(recommendations), uid)
+
+        return ORJSONResponse(payload)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error generating recommendations: {str(e)}", exc_info=True)
+        logger.error("Error generating recommendations: %s", str(e), exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating recommendations: {str(e)}"
@@ -189,7 +225,7 @@ async def submit_recommendation_feedback(
         
         await db.feedback.insert_one(feedback_entry)
         
-        logger.info(f"Feedback received from {uid} for crop: {crop_name}")
+        logger.info("Feedback received from %s for crop: %s", uid, crop_name)
         
         return {
             "message": "Feedback submitted successfully",
@@ -197,7 +233,7 @@ async def submit_recommendation_feedback(
         }
         
     except Exception as e:
-        logger.error(f"Error submitting feedback: {str(e)}")
+        logger.error("Error submitting feedback: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error submitting feedback"
@@ -221,7 +257,7 @@ async def get_recommendation_history(
     
     try:
         # Fetch from cache collection
-        cache_key = f"recommendations_{uid}"
+        cache_key = _reco_cache_key(uid)
         cached = await db.cache.find_one({"key": cache_key})
         
         if not cached:
@@ -238,7 +274,7 @@ async def get_recommendation_history(
         }
         
     except Exception as e:
-        logger.error(f"Error fetching recommendation history: {str(e)}")
+        logger.error("Error fetching recommendation history: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error fetching recommendation history"
@@ -261,17 +297,17 @@ async def clear_recommendation_cache(
         )
     
     try:
-        cache_key = f"recommendations_{uid}"
+        cache_key = _reco_cache_key(uid)
         result = await db.cache.delete_one({"key": cache_key})
         
         if result.deleted_count > 0:
-            logger.info(f"Cleared recommendation cache for {uid}")
+            logger.info("Cleared recommendation cache for %s", uid)
             return {"message": "Cache cleared successfully"}
         else:
             return {"message": "No cache found to clear"}
         
     except Exception as e:
-        logger.error(f"Error clearing cache: {str(e)}")
+        logger.error("Error clearing cache: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error clearing cache"
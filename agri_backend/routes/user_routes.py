@@ -36,14 +36,14 @@ async def get_user_profile(
             )
 
         user.pop("_id", None)  # remove MongoDB internal ID
-        logger.info(f"Retrieved profile for user: {uid}")
+        logger.info("Retrieved profile for user: %s", uid)
 
         return user
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching user profile: {str(e)}")
+        logger.error("Error fetching user profile: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error fetching user profile"
@@ -93,13 +93,13 @@ async def update_user_profile(
         updated_user = await db.users.find_one({"uid": uid})
         updated_user.pop("_id", None)
         
-        logger.info(f"Updated profile for user: {uid}")
+        logger.info("Updated profile for user: %s", uid)
         return updated_user
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error updating user profile: {str(e)}")
+        logger.error("Error updating user profile: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error updating user profile"
@@ -147,7 +147,7 @@ async def add_crop_history(
                 detail=f"User not found: {uid}"
             )
         
-        logger.info(f"Added crop history for user {uid}: {crop_name}")
+        logger.info("Added crop history for user %s: %s", uid, crop_name)
         return {
             "message": "Crop history added successfully",
             "crop_entry": crop_entry
@@ -156,7 +156,7 @@ async def add_crop_history(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error adding crop history: {str(e)}")
+        logger.error("Error adding crop history: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error adding crop history"
@@ -179,26 +179,30 @@ async def get_crop_history(
         )
     
     try:
-        user = await db.users.find_one(
-            {"uid": uid},
-            {"crop_history": 1}
-        )
-        
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"User not found: {uid}"
-            )
-        
-        crop_history = user.get("crop_history", [])
-        
-        # Sort by year and return limited results
-        crop_history = sorted(
-            crop_history,
-            key=lambda x: (x.get("year", 0), x.get("added_at", "")),
-            reverse=True
-        )[:limit]
-        
+        # Sort + limit server-side so only the requested entries are
+        # transferred and Python never sorts the full array
+        cursor = db.users.aggregate([
+            {"$match": {"uid": uid}},
+            {"$project": {"_id": 0, "crop_history": {"$ifNull": ["$crop_history", []]}}},
+            {"$unwind": {"path": "$crop_history", "preserveNullAndEmptyArrays": True}},
+            {"$sort": {"crop_history.year": -1, "crop_history.added_at": -1}},
+            {"$limit": max(limit, 1)},
+            {"$group": {"_id": None, "items": {"$push": "$crop_history"}}}
+        ])
+        results = await cursor.to_list(length=1)
+
+        if not results:
+            # No document matched the uid at all
+            if not await db.users.find_one({"uid": uid}, {"_id": 1}):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"User not found: {uid}"
+                )
+            crop_history = []
+        else:
+            # Empty-history users produce an unwound null entry - filter it
+            crop_history = [item for item in results[0].get("items", []) if item]
+
         return {
             "uid": uid,
             "crop_history": crop_history,
@@ -208,7 +212,7 @@ async def get_crop_history(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching crop history: {str(e)}")
+        logger.error("Error fetching crop history: %s", str(e))
         raise HTTPException(
     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
     detail="Error fetching crop history"
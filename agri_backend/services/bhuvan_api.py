@@ -1,4 +1,8 @@
+import asyncio
+import time
 import httpx
+import orjson
+from types import MappingProxyType
 from typing import Optional, Dict
 import logging
 import os
@@ -9,65 +13,167 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Fallback geocode table (approximate state centers) - built once at import
+# and frozen; lookups just normalize the state name
+_STATE_COORDS = MappingProxyType({
+    "punjab": (30.9010, 75.8573),
+    "haryana": (29.0588, 76.0856),
+    "uttar pradesh": (26.8467, 80.9462),
+    "madhya pradesh": (22.9734, 78.6569),
+    "rajasthan": (27.0238, 74.2179),
+    "maharashtra": (19.7515, 75.7139),
+    "karnataka": (15.3173, 75.7139),
+    "tamil nadu": (11.1271, 78.6569),
+    "andhra pradesh": (15.9129, 79.7400),
+    "telangana": (18.1124, 79.0193),
+    "delhi": (28.7041, 77.1025),
+    "bihar": (25.0961, 85.3131),
+    "west bengal": (22.9868, 87.8550),
+    "odisha": (20.9517, 85.0985),
+    "kerala": (10.8505, 76.2711),
+    "gujarat": (22.2587, 71.1924)
+})
+
+# Center of India - used when the state isn't in the table
+_INDIA_CENTER = (20.5937, 78.9629)
+
+# Geocodes and soil properties change slowly - cache them in-process for a
+# day so users in the same village don't re-trigger external API calls
+CACHE_TTL_SECONDS = 86400
+CACHE_MAXSIZE = 4096
+
+# SoilGrids layer name -> (result key, converted value); adding a layer is
+# one entry here instead of another elif branch in the parse loop
+_SOILGRID_HANDLERS = {
+    "phh2o": lambda v: ("ph", v / 10),  # Convert to pH scale
+    "soc": lambda v: ("organic_carbon", v / 10),
+    "nitrogen": lambda v: ("nitrogen", "high" if v > 2000 else "medium" if v > 1000 else "low"),
+}
+
 class BhuvanAPIService:
     """Service for interacting with Bhuvan APIs"""
-    
+
     BASE_URL = "https://bhuvan-app3.nrsc.gov.in/api"
     
     def __init__(self):
         # Two separate tokens
         self.geocode_token = os.getenv("BHUVAN_GEOCODE_TOKEN", "")
         self.lulc_token = os.getenv("BHUVAN_LULC_TOKEN", "")
-        
+
+        # One long-lived client for all outbound calls - keep-alive reuses
+        # sockets instead of paying a TCP+TLS handshake per request, and
+        # HTTP/2 multiplexes concurrent fetches over one TLS session per host
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=30.0
+            )
+        )
+
         if not self.geocode_token:
             logger.warning("BHUVAN_GEOCODE_TOKEN not set. Geocode will use fallback data.")
         if not self.lulc_token:
             logger.warning("BHUVAN_LULC_TOKEN not set. LULC will use fallback data.")
-            
+
+        # TTL cache for external API results: {key: (value, expiry_ts)}
+        self._api_cache: Dict = {}
+
+        # In-flight fetches keyed like the cache - concurrent requests for
+        # the same key await one task instead of fanning out duplicates
+        self._inflight: Dict = {}
+
+    async def aclose(self):
+        """Close the shared HTTP client (called from app shutdown)"""
+        await self._client.aclose()
+
+    def _cache_get(self, key):
+        entry = self._api_cache.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def _cache_set(self, key, value):
+        if len(self._api_cache) >= CACHE_MAXSIZE:
+            # Wholesale eviction keeps the bookkeeping trivial; hot keys
+            # repopulate on the next fetch
+            self._api_cache.clear()
+        self._api_cache[key] = (value, time.monotonic() + CACHE_TTL_SECONDS)
+
+    async def _single_flight(self, key, fetch):
+        """
+        Dedupe concurrent fetches: the first caller for a key runs the fetch,
+        later callers await the same task (e.g. a whole village hitting
+        /recommendations right after a cache flush)
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            try:
+                return await task
+            finally:
+                self._inflight.pop(key, None)
+        return await task
+
     async def get_village_geocode(self, village: str, state: str) -> Optional[Dict]:
         """
         Get latitude and longitude for a village
         Returns: {"lat": float, "lon": float, "village": str}"""
         headers = {"Authorization": f"Bearer {self.geocode_token}", "Content-Type": "application/json"}
         if not self.geocode_token:
-            logger.info(f"No Geocode token - using fallback geocode for {village}, {state}")
+            logger.info("No Geocode token - using fallback geocode for %s, %s", village, state)
             return self._get_fallback_geocode(village, state)
-           
+
+        cache_key = ("geocode", village.strip().lower(), state.strip().lower())
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        return await self._single_flight(
+            cache_key,
+            lambda: self._fetch_village_geocode(village, state, headers, cache_key)
+        )
+
+    async def _fetch_village_geocode(self, village: str, state: str,
+                                     headers: Dict, cache_key) -> Optional[Dict]:
+        """Fetch a geocode from the Bhuvan API (single-flighted)"""
         try:
-            # If no token, use fallback immediately
-           
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Bhuvan Geocode API endpoint
-                url = f"{self.BASE_URL}/geocode"
-                params = {
-                    "village": village,
-                    "state": state,
-                    "format": "json"
+            # Bhuvan Geocode API endpoint
+            url = f"{self.BASE_URL}/geocode"
+            params = {
+                "village": village,
+                "state": state,
+                "format": "json"
+            }
+
+            response = await self._client.get(url, params=params, headers=headers)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+
+            if data and len(data) > 0:
+                result = data[0]
+                geocode = {
+                    "lat": float(result.get("lat", 0)),
+                    "lon": float(result.get("lon", 0)),
+                    "village": result.get("display_name", village),
+                    "district": result.get("district", ""),
+                    "state": result.get("state", state)
                 }
-                
-                response = await client.get(url, params=params, headers=self.headers)
-                response.raise_for_status()
-                data = response.json()
-                
-                if data and len(data) > 0:
-                    result = data[0]
-                    return {
-                        "lat": float(result.get("lat", 0)),
-                        "lon": float(result.get("lon", 0)),
-                        "village": result.get("display_name", village),
-                        "district": result.get("district", ""),
-                        "state": result.get("state", state)
-                    }
-                
-                logger.warning(f"No geocode found for {village}, {state}")
-                return self._get_fallback_geocode(village, state)
-                
+                self._cache_set(cache_key, geocode)
+                return geocode
+
+            logger.warning("No geocode found for %s, %s", village, state)
+            return self._get_fallback_geocode(village, state)
+
         except httpx.HTTPError as e:
-            logger.error(f"Bhuvan geocode API error: {str(e)}")
+            logger.error("Bhuvan geocode API error: %s", str(e))
             # Fallback to dummy coordinates for development
             return self._get_fallback_geocode(village, state)
         except Exception as e:
-            logger.error(f"Unexpected error in geocode: {str(e)}")
+            logger.error("Unexpected error in geocode: %s", str(e))
             return self._get_fallback_geocode(village, state)
     
     async def get_lulc_data(self, lat: float, lon: float) -> Optional[Dict]:
@@ -78,40 +184,36 @@ class BhuvanAPIService:
         headers = {"Authorization": f"Bearer {self.lulc_token}", "Content-Type": "application/json"}
         
         if not self.lulc_token:
-            logger.info(f"No LULC token - using fallback LULC for {lat}, {lon}")
+            logger.info("No LULC token - using fallback LULC for %s, %s", lat, lon)
             return self._get_fallback_lulc(lat, lon)
         
         try:
-            # If no token, use fallback immediately
-            
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Bhuvan LULC WMS/WFS service
-                url = f"{self.BASE_URL}/lulc/query"
-                params = {
-                    "lat": lat,
-                    "lon": lon,
-                    "buffer": 500,  # 500m buffer
-                    "format": "json"
-                }
-                
-                response = await client.get(url, params=params, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                
-                return {
-                    "soil_type": data.get("soil_type", "loamy"),
-                    "land_use": data.get("land_use", "agricultural"),
-                    "vegetation_index": data.get("ndvi", 0.5),
-                    "soil_moisture": data.get("moisture", "medium"),
-                    "elevation": data.get("elevation", 300)
-                }
-                
+            # Bhuvan LULC WMS/WFS service
+            url = f"{self.BASE_URL}/lulc/query"
+            params = {
+                "lat": lat,
+                "lon": lon,
+                "buffer": 500,  # 500m buffer
+                "format": "json"
+            }
+
+            response = await self._client.get(url, params=params, headers=headers)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+
+            return {
+                "soil_type": data.get("soil_type", "loamy"),
+                "land_use": data.get("land_use", "agricultural"),
+                "vegetation_index": data.get("ndvi", 0.5),
+                "soil_moisture": data.get("moisture", "medium"),
+                "elevation": data.get("elevation", 300)
+            }
+
         except httpx.HTTPError as e:
-            logger.error(f"Bhuvan LULC API error: {str(e)}")
+            logger.error("Bhuvan LULC API error: %s", str(e))
             return self._get_fallback_lulc(lat, lon)
         except Exception as e:
-            logger.error(f"Unexpected error in LULC: {str(e)}")
+            logger.error("Unexpected error in LULC: %s", str(e))
             return self._get_fallback_lulc(lat, lon)
     
     async def get_soil_properties(self, lat: float, lon: float) -> Optional[Dict]:
@@ -120,12 +222,20 @@ class BhuvanAPIService:
         Uses SoilGrids API as fallback if Bhuvan doesn't provide
         """
         try:
-            # Try Bhuvan first
-            lulc_data = await self.get_lulc_data(lat, lon)
-            
-            # Enrich with SoilGrids data
-            soil_grid_data = await self._get_soilgrids_data(lat, lon)
-            
+            # Bhuvan LULC and SoilGrids are independent - fetch them
+            # concurrently instead of stacking two roundtrips
+            lulc_data, soil_grid_data = await asyncio.gather(
+                self.get_lulc_data(lat, lon),
+                self._get_soilgrids_data(lat, lon),
+                return_exceptions=True
+            )
+            if isinstance(lulc_data, BaseException):
+                logger.error("LULC fetch failed: %s", str(lulc_data))
+                lulc_data = self._get_fallback_lulc(lat, lon)
+            if isinstance(soil_grid_data, BaseException):
+                logger.error("SoilGrids fetch failed: %s", str(soil_grid_data))
+                soil_grid_data = {}
+
             if lulc_data and soil_grid_data:
                 return {
                     **lulc_data,
@@ -139,75 +249,64 @@ class BhuvanAPIService:
             return lulc_data or soil_grid_data or self._get_fallback_soil_properties()
             
         except Exception as e:
-            logger.error(f"Error getting soil properties: {str(e)}")
+            logger.error("Error getting soil properties: %s", str(e))
             return self._get_fallback_soil_properties()
     
     async def _get_soilgrids_data(self, lat: float, lon: float) -> Optional[Dict]:
         """Get data from SoilGrids API (ISRIC)"""
+        # Round to ~100m so nearby coordinates share a cache entry
+        cache_key = ("soilgrids", round(lat, 3), round(lon, 3))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        return await self._single_flight(
+            cache_key,
+            lambda: self._fetch_soilgrids_data(lat, lon, cache_key)
+        )
+
+    async def _fetch_soilgrids_data(self, lat: float, lon: float, cache_key) -> Optional[Dict]:
+        """Fetch soil properties from SoilGrids (single-flighted)"""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                url = "https://rest.isric.org/soilgrids/v2.0/properties/query"
-                params = {
-                    "lon": lon,
-                    "lat": lat,
-                    "property": ["phh2o", "soc", "nitrogen"],
-                    "depth": "0-5cm",
-                    "value": "mean"
-                }
-                
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                properties = data.get("properties", {})
-                layers = properties.get("layers", [])
-                
-                result = {}
-                for layer in layers:
-                    name = layer.get("name")
-                    depths = layer.get("depths", [])
-                    if depths:
-                        value = depths[0].get("values", {}).get("mean", 0)
-                        
-                        if name == "phh2o":
-                            result["ph"] = value / 10  # Convert to pH scale
-                        elif name == "soc":
-                            result["organic_carbon"] = value / 10
-                        elif name == "nitrogen":
-                            result["nitrogen"] = "high" if value > 2000 else "medium" if value > 1000 else "low"
-                
-                logger.info(f"SoilGrids data retrieved for {lat}, {lon}")
-                return result
-                
+            url = "https://rest.isric.org/soilgrids/v2.0/properties/query"
+            params = {
+                "lon": lon,
+                "lat": lat,
+                "property": ["phh2o", "soc", "nitrogen"],
+                "depth": "0-5cm",
+                "value": "mean"
+            }
+
+            response = await self._client.get(url, params=params)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+
+            properties = data.get("properties", {})
+            layers = properties.get("layers", [])
+
+            result = {}
+            for layer in layers:
+                handler = _SOILGRID_HANDLERS.get(layer.get("name"))
+                depths = layer.get("depths", [])
+                if handler and depths:
+                    value = depths[0].get("values", {}).get("mean", 0)
+                    key, converted = handler(value)
+                    result[key] = converted
+
+            logger.info("SoilGrids data retrieved for %s, %s", lat, lon)
+            if result:
+                self._cache_set(cache_key, result)
+            return result
+
         except Exception as e:
-            logger.error(f"SoilGrids API error: {str(e)}")
+            logger.error("SoilGrids API error: %s", str(e))
             return {}
     
     def _get_fallback_geocode(self, village: str, state: str) -> Dict:
         """Fallback geocode data for development"""
-        # Common state coordinates (approximate centers)
-        state_coords = {
-            "punjab": (30.9010, 75.8573),
-            "haryana": (29.0588, 76.0856),
-            "uttar pradesh": (26.8467, 80.9462),
-            "madhya pradesh": (22.9734, 78.6569),
-            "rajasthan": (27.0238, 74.2179),
-            "maharashtra": (19.7515, 75.7139),
-            "karnataka": (15.3173, 75.7139),
-            "tamil nadu": (11.1271, 78.6569),
-            "andhra pradesh": (15.9129, 79.7400),
-            "telangana": (18.1124, 79.0193),
-            "delhi": (28.7041, 77.1025),
-            "bihar": (25.0961, 85.3131),
-            "west bengal": (22.9868, 87.8550),
-            "odisha": (20.9517, 85.0985),
-            "kerala": (10.8505, 76.2711),
-            "gujarat": (22.2587, 71.1924)
-        }
-        
-        coords = state_coords.get(state.lower(), (20.5937, 78.9629))  # India center
-        
-        logger.info(f"Using fallback geocode for {village}, {state}: {coords}")
+        coords = _STATE_COORDS.get(state.lower(), _INDIA_CENTER)
+
+        logger.info("Using fallback geocode for %s, %s: %s", village, state, coords)
         
         return {
             "lat": coords[0],
@@ -220,7 +319,7 @@ class BhuvanAPIService:
     
     def _get_fallback_lulc(self, lat: float, lon: float) -> Dict:
         """Fallback LULC data based on region"""
-        logger.info(f"Using fallback LULC data for {lat}, {lon}")
+        logger.info("Using fallback LULC data for %s, %s", lat, lon)
         
         return {
             "soil_type": "loamy",
@@ -1,24 +1,35 @@
+import asyncio
 import os
+import re
+import time
 import google.generativeai as genai
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Sequence
 import logging
 from PIL import Image
 import io
 
+from services.recommender import recommender_service
+from services.semantic_cache import SemanticCache, normalize_message
+
 logger = logging.getLogger(__name__)
 
-class GeminiService:
-    def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY", "")
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            logger.warning("GEMINI_API_KEY not found, using mock responses")
-            self.model = None
-        
-        # System prompt for agriculture context
-        self.system_prompt = """You are an expert AI Agricultural Assistant for Indian farmers. 
+# Warm semantic-cache entries survive restarts via this file
+SEMANTIC_CACHE_PATH = "semantic_cache.json"
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# Server-side cache of the static system prompt - cached prefix tokens are
+# billed at a discount and skipped during prefill
+CONTEXT_CACHE_TTL_SECONDS = 3600
+
+# Cap on overlapping Gemini calls in a batch - enough to hide latency
+# without tripping per-project rate limits
+BATCH_CONCURRENCY = 16
+
+# System prompt for agriculture context - parsed once at import and
+# shared by every instance (and forked worker)
+SYSTEM_PROMPT = """You are an expert AI Agricultural Assistant for Indian farmers. 
 
 Your role:
 - Provide accurate, practical farming advice
@@ -48,128 +59,495 @@ Format responses with:
 - Step-by-step instructions when needed
 - Emoji for visual appeal (but use sparingly)"""
 
-    def generate_response(
-        self, 
-        message: str, 
+# Topic routing: one compiled regex pass over the message instead of the
+# any(word in ...) ladders. Deliberately unanchored so substring semantics
+# match the original checks ("growing", "crops", "grain" all count), and
+# each word group gets its own name because the suggestion and mock
+# ladders weigh the same words differently (e.g. "rain" is an irrigation
+# cue for suggestions but a weather cue for the mock response)
+_TOPIC_RE = re.compile(
+    r"(?P<crop>crop|plant|grow|recommend)"
+    r"|(?P<disease>disease|pest|problem|leaf)"
+    r"|(?P<sick>sick)"
+    r"|(?P<price>price|market|sell)"
+    r"|(?P<mandi>rate|mandi)"
+    r"|(?P<water>water|irrigation)"
+    r"|(?P<rain>rain)"
+    r"|(?P<weather>weather|temperature|forecast)"
+)
+
+# Recommendation detection in responses: one case-insensitive C-level scan
+# instead of lowercasing the whole response and substring-searching thrice
+_RECO_RE = re.compile(r"recommend|suggest|advise", re.IGNORECASE)
+
+# Follow-up suggestions per topic - immutable tuples shared across
+# requests, one dict lookup per call and nothing allocated
+_SUGGESTION_TABLE = {
+    "crop": (
+        "What is the best irrigation schedule?",
+        "How to prepare soil for planting?",
+        "What fertilizers should I use?"
+    ),
+    "disease": (
+        "How can I prevent this in future?",
+        "What organic treatments are available?",
+        "How much will treatment cost?"
+    ),
+    "price": (
+        "When is the best time to sell?",
+        "Which crops have highest demand?",
+        "How to get better prices?"
+    ),
+    "water": (
+        "How to save water?",
+        "What is drip irrigation cost?",
+        "How to check soil moisture?"
+    )
+}
+
+_DEFAULT_SUGGESTIONS = (
+    "What crops should I grow?",
+    "How is the weather forecast?",
+    "What are current market prices?"
+)
+
+
+def _context_signature(user_context: Optional[Dict]) -> str:
+    """
+    The user_context fields that shape the prompt (via _build_context)
+    plus language. Cached answers are only shared between farmers whose
+    signatures match, so a location-personalized response never leaks to
+    a farmer elsewhere.
+    """
+    if not user_context:
+        return ""
+    return "|".join(
+        str(user_context.get(field, ""))
+        for field in ("language", "village", "state", "district", "land_size")
+    )
+
+
+def _match_topics(message_lower: str) -> frozenset:
+    """Collect every topic word group present in the message in one scan"""
+    return frozenset(m.lastgroup for m in _TOPIC_RE.finditer(message_lower))
+
+
+# Gemini downscales images to roughly this resolution anyway - resizing
+# before upload cuts the payload of a phone-camera photo several-fold
+GEMINI_IMAGE_MAX_EDGE = 768
+
+
+def _decode_and_resize(image_bytes: bytes) -> Image.Image:
+    """
+    Decode an uploaded image and bound it to Gemini's effective
+    resolution. CPU-bound (JPEG/PNG decode + LANCZOS resample) - callers
+    run this via asyncio.to_thread so it never blocks the event loop.
+    """
+    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    img.thumbnail((GEMINI_IMAGE_MAX_EDGE, GEMINI_IMAGE_MAX_EDGE),
+                  Image.Resampling.LANCZOS)
+    return img
+
+class GeminiService:
+    # Fixed attribute set - slot storage instead of a per-instance __dict__
+    __slots__ = ("api_key", "model", "semantic_cache",
+                 "_context_cache", "_context_cache_created", "_cached_model",
+                 "_context_cache_lock")
+
+    def __init__(self):
+        self.api_key = os.getenv("GEMINI_API_KEY", "")
+        self._context_cache = None
+        self._context_cache_created = 0.0
+        self._cached_model = None
+        self._context_cache_lock = asyncio.Lock()
+        if self.api_key:
+            genai.configure(api_key=self.api_key)
+            self.model = genai.GenerativeModel(GEMINI_MODEL)
+        else:
+            logger.warning("GEMINI_API_KEY not found, using mock responses")
+            self.model = None
+
+        # Near-duplicate questions ("what should I grow?" etc.) are common -
+        # answer them from cache instead of re-querying Gemini
+        self.semantic_cache = SemanticCache()
+        self.semantic_cache.load(SEMANTIC_CACHE_PATH)
+
+        if self.model:
+            self._create_context_cache()
+
+    def _create_context_cache(self):
+        """
+        Register the static system prompt as server-side CachedContent.
+
+        Blocking SDK call - runs at startup and, on refresh, inside
+        asyncio.to_thread so it never stalls the event loop. Note the API
+        enforces a minimum cached token count (4096 tokens for 2.5-flash),
+        well above this ~1.5 KB prompt, so on current models create() is
+        expected to fail and every request sends the prompt inline; the
+        code path pays off as the prompt grows past the floor.
+        """
+        previous = self._context_cache
+        try:
+            self._context_cache = genai.caching.CachedContent.create(
+                model=GEMINI_MODEL,
+                system_instruction=SYSTEM_PROMPT,
+                ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s"
+            )
+            self._context_cache_created = time.monotonic()
+            # One model bound to the cache, reused for every request until
+            # the cache itself is refreshed - model construction is not free
+            self._cached_model = genai.GenerativeModel.from_cached_content(
+                self._context_cache
+            )
+            logger.info("Gemini context cache created: %s", self._context_cache.name)
+        except Exception as e:
+            # Not fatal - requests fall back to sending the prompt inline
+            self._context_cache = None
+            self._cached_model = None
+            logger.warning("Gemini context caching unavailable: %s", str(e))
+
+        # Drop the superseded server-side cache instead of leaking one
+        # per refresh until its TTL expires
+        if previous is not None:
+            try:
+                previous.delete()
+            except Exception as e:
+                logger.warning("Failed to delete old context cache: %s", str(e))
+
+    async def _get_model(self):
+        """
+        Return (model, prompt_cached). When the context cache is live the
+        model already carries the system prompt server-side and callers
+        send only the dynamic part; the cache is recreated shortly before
+        its TTL runs out (off the event loop, one refresher at a time).
+        """
+        if self._context_cache is not None:
+            age = time.monotonic() - self._context_cache_created
+            if age > CONTEXT_CACHE_TTL_SECONDS - 60:
+                async with self._context_cache_lock:
+                    # Re-check: a concurrent request may have refreshed
+                    # while this one waited on the lock
+                    age = time.monotonic() - self._context_cache_created
+                    if (self._context_cache is not None
+                            and age > CONTEXT_CACHE_TTL_SECONDS - 60):
+                        await asyncio.to_thread(self._create_context_cache)
+            if self._cached_model is not None:
+                return self._cached_model, True
+        return self.model, False
+
+    async def generate_response(
+        self,
+        message: str,
         user_context: Optional[Dict] = None,
         image: Optional[bytes] = None,
         chat_history: Optional[List[Dict]] = None
     ) -> Dict:
         """
-        Generate AI response using Gemini
+        Generate AI response using Gemini (async - the Gemini roundtrip no
+        longer blocks the event loop, so concurrent chats overlap)
         """
         try:
             if not self.model:
                 return self._generate_mock_response(message, user_context)
-            
-            # Build context-aware prompt
+
+            # Semantic cache (text-only queries): exact hash match first,
+            # then embedding similarity - either hit skips the Gemini call.
+            # Keyed by the farmer-context signature so personalized answers
+            # are never shared across farmers
+            context_sig = _context_signature(user_context)
+            cache_key = None
+            embedding = None
+            if image is None:
+                cache_key, embedding, cached = await self._check_semantic_cache(
+                    message, context_sig
+                )
+                if cached is not None:
+                    return cached
+
+            # Build context-aware prompt. Static content (system prompt)
+            # stays strictly at the front so prefix caching applies; when the
+            # server-side context cache is live it isn't sent at all
+            model, prompt_cached = await self._get_model()
             context_info = self._build_context(user_context)
-            full_prompt = f"{self.system_prompt}\n\n{context_info}\n\nUser Question: {message}"
-            
-            # Handle image + text query
+            if prompt_cached:
+                full_prompt = f"{context_info}\n\nUser Question: {message}"
+            else:
+                full_prompt = f"{SYSTEM_PROMPT}\n\n{context_info}\n\nUser Question: {message}"
+
+            # Handle image + text query (decode/resize runs off the loop;
+            # the resized PIL image goes to the SDK without re-encoding)
             if image:
-                img = Image.open(io.BytesIO(image))
-                response = self.model.generate_content([full_prompt, img])
+                img = await asyncio.to_thread(_decode_and_resize, image)
+                response = await model.generate_content_async([full_prompt, img])
             else:
-                response = self.model.generate_content(full_prompt)
-            
+                response = await model.generate_content_async(full_prompt)
+
             # Extract response
             response_text = response.text
-            
+
             # Generate suggestions based on query
             suggestions = self._generate_suggestions(message, response_text)
-            
+
             # Extract metadata
             metadata = self._extract_metadata(response_text, user_context)
-            
-            return {
+
+            result = {
                 "response": response_text,
                 "suggestions": suggestions,
                 "metadata": metadata,
                 "status": "success"
             }
-            
+
+            if cache_key is not None and embedding is not None:
+                self.semantic_cache.put(cache_key, embedding, context_sig, result)
+
+            return result
+
         except Exception as e:
-            logger.error(f"Gemini API error: {str(e)}")
+            logger.error("Gemini API error: %s", str(e))
             return self._generate_fallback_response(message, user_context)
+
+    async def _check_semantic_cache(self, message: str, context_sig: str):
+        """
+        Look the question up in the semantic cache, scoped to the farmer's
+        context signature (see _context_signature).
+        Returns (exact_key, embedding, cached_response_or_None); the key and
+        embedding are reused to store the fresh answer on a miss.
+        """
+        season = recommender_service.get_current_season()
+
+        normalized = normalize_message(message)
+        cache_key = SemanticCache.exact_key(normalized, context_sig, season)
+
+        cached = self.semantic_cache.get_exact(cache_key)
+        if cached is not None:
+            logger.info("Semantic cache exact hit")
+            return cache_key, None, cached
+
+        embedding = None
+        try:
+            emb = await genai.embed_content_async(
+                model=EMBEDDING_MODEL, content=normalized
+            )
+            embedding = emb["embedding"]
+            cached = self.semantic_cache.get_similar(embedding, context_sig)
+            if cached is not None:
+                return cache_key, embedding, cached
+        except Exception as e:
+            # Embedding failures only cost us the cache, not the answer
+            logger.warning("Semantic cache embedding failed: %s", str(e))
+
+        return cache_key, embedding, None
     
+    async def generate_response_stream(
+        self,
+        message: str,
+        user_context: Optional[Dict] = None,
+        image: Optional[bytes] = None
+    ):
+        """
+        Stream the Gemini answer as it is generated, so the first tokens
+        reach the client at first-chunk latency instead of waiting for the
+        whole response.
+
+        Yields {"type": "chunk", "text": ...} events followed by one
+        {"type": "done", ...} event carrying suggestions and metadata.
+        Mock, cache-hit and error paths emit a single chunk. The
+        non-streaming generate_response stays for callers that need the
+        full text upfront (batch jobs, cache writes).
+        """
+        if not self.model:
+            result = self._generate_mock_response(message, user_context)
+            yield {"type": "chunk", "text": result["response"]}
+            yield {"type": "done", "suggestions": result["suggestions"],
+                   "metadata": result["metadata"], "status": result["status"]}
+            return
+
+        context_sig = _context_signature(user_context)
+        cache_key = None
+        embedding = None
+        if image is None:
+            cache_key, embedding, cached = await self._check_semantic_cache(
+                message, context_sig
+            )
+            if cached is not None:
+                yield {"type": "chunk", "text": cached["response"]}
+                yield {"type": "done", "suggestions": cached["suggestions"],
+                       "metadata": cached["metadata"], "status": cached["status"]}
+                return
+
+        try:
+            model, prompt_cached = await self._get_model()
+            context_info = self._build_context(user_context)
+            if prompt_cached:
+                full_prompt = f"{context_info}\n\nUser Question: {message}"
+            else:
+                full_prompt = f"{SYSTEM_PROMPT}\n\n{context_info}\n\nUser Question: {message}"
+
+            if image:
+                img = await asyncio.to_thread(_decode_and_resize, image)
+                stream = await model.generate_content_async([full_prompt, img], stream=True)
+            else:
+                stream = await model.generate_content_async(full_prompt, stream=True)
+
+            parts = []
+            async for chunk in stream:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield {"type": "chunk", "text": chunk.text}
+
+            # Post-processing happens once the full text has accumulated
+            response_text = "".join(parts)
+            suggestions = self._generate_suggestions(message, response_text)
+            metadata = self._extract_metadata(response_text, user_context)
+
+            if cache_key is not None and embedding is not None:
+                self.semantic_cache.put(cache_key, embedding, context_sig, {
+                    "response": response_text,
+                    "suggestions": suggestions,
+                    "metadata": metadata,
+                    "status": "success"
+                })
+
+            yield {"type": "done", "suggestions": suggestions,
+                   "metadata": metadata, "status": "success"}
+
+        except Exception as e:
+            logger.error("Gemini streaming error: %s", str(e))
+            result = self._generate_fallback_response(message, user_context)
+            yield {"type": "chunk", "text": result["response"]}
+            yield {"type": "done", "suggestions": result["suggestions"],
+                   "metadata": result["metadata"], "status": result["status"]}
+
+    async def generate_batch(self, items: List[Dict]) -> List[Dict]:
+        """
+        Generate responses for many prompts concurrently, with bounded
+        fan-out.
+
+        Meant for throughput-bound work (e.g. nightly advisory generation).
+        Each item is {"message": str, "user_context": Optional[dict]};
+        results come back in input order. The google-generativeai SDK used
+        here exposes no batch-job endpoint, so the requests are issued as
+        overlapping generate_response calls capped by a semaphore - wall
+        clock is bounded by the slowest window of BATCH_CONCURRENCY calls
+        rather than the sum of all roundtrips.
+        """
+        if not self.model:
+            return [
+                self._generate_mock_response(item["message"], item.get("user_context"))
+                for item in items
+            ]
+
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def bounded(item):
+            async with semaphore:
+                return await self.generate_response(
+                    item["message"], item.get("user_context")
+                )
+
+        return list(await asyncio.gather(*(bounded(item) for item in items)))
+
     def _build_context(self, user_context: Optional[Dict]) -> str:
         """Build context information for better responses"""
         if not user_context:
             return ""
-        
-        context_parts = ["**Farmer Context:**"]
-        
+
+        # Only a handful of fields - concatenate directly instead of
+        # allocating a list just to join it
+        context = "**Farmer Context:**"
+
         if user_context.get("village"):
-            context_parts.append(f"- Location: {user_context['village']}, {user_context.get('state', '')}")
-        
+            context += f"\n- Location: {user_context['village']}, {user_context.get('state', '')}"
+
         if user_context.get("district"):
-            context_parts.append(f"- District: {user_context['district']}")
-        
+            context += f"\n- District: {user_context['district']}"
+
         if user_context.get("land_size"):
-            context_parts.append(f"- Farm Size: {user_context['land_size']} acres")
-        
+            context += f"\n- Farm Size: {user_context['land_size']} acres"
+
         # Add current season
-        from services.recommender import recommender_service
-        season = recommender_service.get_current_season()
-        context_parts.append(f"- Current Season: {season}")
-        
-        return "\n".join(context_parts)
+        context += f"\n- Current Season: {recommender_service.get_current_season()}"
+
+        return context
     
-    def _generate_suggestions(self, message: str, response: str) -> List[str]:
+    def _generate_suggestions(self, message: str, response: str) -> Sequence[str]:
         """Generate follow-up suggestions"""
-        message_lower = message.lower()
-        
-        suggestions = []
-        
-        if any(word in message_lower for word in ['crop', 'plant', 'grow', 'recommend']):
-            suggestions = [
-                "What is the best irrigation schedule?",
-                "How to prepare soil for planting?",
-                "What fertilizers should I use?"
-            ]
-        elif any(word in message_lower for word in ['disease', 'pest', 'problem', 'leaf']):
-            suggestions = [
-                "How can I prevent this in future?",
-                "What organic treatments are available?",
-                "How much will treatment cost?"
-            ]
-        elif any(word in message_lower for word in ['price', 'market', 'sell']):
-            suggestions = [
-                "When is the best time to sell?",
-                "Which crops have highest demand?",
-                "How to get better prices?"
-            ]
-        elif any(word in message_lower for word in ['water', 'irrigation', 'rain']):
-            suggestions = [
-                "How to save water?",
-                "What is drip irrigation cost?",
-                "How to check soil moisture?"
-            ]
-        else:
-            suggestions = [
-                "What crops should I grow?",
-                "How is the weather forecast?",
-                "What are current market prices?"
-            ]
-        
-        return suggestions[:3]  # Return top 3
+        topics = _match_topics(message.lower())
+        if "crop" in topics:
+            return _SUGGESTION_TABLE["crop"]
+        if "disease" in topics:
+            return _SUGGESTION_TABLE["disease"]
+        if "price" in topics:
+            return _SUGGESTION_TABLE["price"]
+        if "water" in topics or "rain" in topics:
+            return _SUGGESTION_TABLE["water"]
+        return _DEFAULT_SUGGESTIONS
     
     def _extract_metadata(self, response: str, user_context: Optional[Dict]) -> Dict:
         """Extract metadata from response"""
         metadata = {
             "language": user_context.get("language", "en") if user_context else "en",
             "response_length": len(response),
-            "has_recommendations": any(word in response.lower() for word in ['recommend', 'suggest', 'advise'])
+            "has_recommendations": _RECO_RE.search(response) is not None
         }
         return metadata
     
     def _generate_mock_response(self, message: str, user_context: Optional[Dict]) -> Dict:
         """Generate mock response when API key is not available"""
         location = f"{user_context.get('village', 'your area')}, {user_context.get('state', '')}" if user_context else "your area"
-        
-        mock_responses = {
-            "crop": f"""**Crop Recommendations for {location}**
+
+        topics = _match_topics(message.lower())
+        if "disease" in topics or "sick" in topics:
+            template = _MOCK_TEMPLATES["disease"]
+        elif "weather" in topics or "rain" in topics:
+            template = _MOCK_TEMPLATES["weather"]
+        elif "price" in topics or "mandi" in topics:
+            template = _MOCK_TEMPLATES["price"]
+        else:
+            template = _MOCK_TEMPLATES["crop"]
+        response_text = template.format(location=location)
+
+        suggestions = self._generate_suggestions(message, response_text)
+
+        return {
+            "response": response_text,
+            "suggestions": suggestions,
+            "metadata": {"mock": True},
+            "status": "success"
+        }
+
+    def _generate_fallback_response(self, message: str, user_context: Optional[Dict]) -> Dict:
+        """Fallback response on error"""
+        return {
+            "response": """I apologize, but I'm having trouble processing your request right now.
+
+Here's what you can do:
+1. Try asking your question again
+2. Check your internet connection
+3. Contact local agricultural extension officer
+
+**Common Topics I Can Help With:**
+🌾 Crop recommendations
+💧 Irrigation guidance
+🦠 Disease identification
+💰 Market prices
+🌡️ Weather information
+
+Please try asking again!""",
+            "suggestions": [
+                "What crops should I plant?",
+                "Show me market prices",
+                "How is the weather?"
+            ],
+            "metadata": {"error": True},
+            "status": "error"
+        }
+
+# Canned responses for development without an API key - built once at
+# import; only the location is formatted in per call
+_MOCK_TEMPLATES = {
+    "crop": """**Crop Recommendations for {location}**
 
 Based on current conditions, here are the best crops:
 
@@ -201,7 +579,7 @@ Based on current conditions, here are the best crops:
 
 Would you like detailed growing instructions?""",
             
-            "disease": """**Plant Disease Analysis**
+    "disease": """**Plant Disease Analysis**
 
 To provide accurate diagnosis, I need a clear photo of:
 📸 Affected leaves or plant parts
@@ -233,7 +611,7 @@ To provide accurate diagnosis, I need a clear photo of:
 
 Please upload an image for specific diagnosis!""",
             
-            "weather": f"""**Weather Forecast for {location}**
+    "weather": """**Weather Forecast for {location}**
 
 🌡️ **Current Conditions:**
 - Temperature: 22°C (Comfortable)
@@ -258,7 +636,7 @@ Please upload an image for specific diagnosis!""",
 
 Stay updated with daily forecasts!""",
             
-            "price": f"""**Market Prices - {location} Mandi**
+    "price": """**Market Prices - {location} Mandi**
 
 💰 **Today's Rates:**
 
@@ -284,54 +662,7 @@ Stay updated with daily forecasts!""",
 Wheat prices expected to rise by 3-5% next month due to good demand.
 
 Would you like price predictions for specific crops?"""
-        }
-        
-        # Match response based on keywords
-        message_lower = message.lower()
-        response_text = mock_responses.get("crop")  # default
-        
-        if any(word in message_lower for word in ['disease', 'pest', 'problem', 'leaf', 'sick']):
-            response_text = mock_responses['disease']
-        elif any(word in message_lower for word in ['weather', 'rain', 'temperature', 'forecast']):
-            response_text = mock_responses['weather']
-        elif any(word in message_lower for word in ['price', 'market', 'sell', 'rate', 'mandi']):
-            response_text = mock_responses['price']
-        
-        suggestions = self._generate_suggestions(message, response_text)
-        
-        return {
-            "response": response_text,
-            "suggestions": suggestions,
-            "metadata": {"mock": True},
-            "status": "success"
-        }
-    
-    def _generate_fallback_response(self, message: str, user_context: Optional[Dict]) -> Dict:
-        """Fallback response on error"""
-        return {
-            "response": """I apologize, but I'm having trouble processing your request right now. 
-
-Here's what you can do:
-1. Try asking your question again
-2. Check your internet connection
-3. Contact local agricultural extension officer
-
-**Common Topics I Can Help With:**
-🌾 Crop recommendations
-💧 Irrigation guidance
-🦠 Disease identification
-💰 Market prices
-🌡️ Weather information
-
-Please try asking again!""",
-            "suggestions": [
-                "What crops should I plant?",
-                "Show me market prices",
-                "How is the weather?"
-            ],
-            "metadata": {"error": True},
-            "status": "error"
-        }
+}
 
 # Singleton instance
 gemini_service = GeminiService()
\ No newline at end of file
@@ -1,274 +1,393 @@
 from typing import List, Dict
 from datetime import datetime
+from functools import lru_cache
 import math
+import sys
+import numpy as np
 from models.recommendation import CropRecommendation
 
+# Persistent cache of recommendation outputs - survives restarts, unlike
+# the in-process lru_cache. Optional: without diskcache installed the
+# in-memory path still works
+try:
+    import diskcache
+    _DISK_CACHE = diskcache.Cache(".reco_cache")
+except Exception:
+    _DISK_CACHE = None
+
+DISK_CACHE_TTL_SECONDS = 86400
+
+# Season membership as bit flags so the season check vectorizes to one
+# bitwise AND across all crops
+_SEASON_BITS = {"Kharif": 1, "Rabi": 2, "Summer": 4, "Year-round": 8}
+
+# Interned verdict fragments - reused across every reasoning string
+_PH_OPTIMAL = sys.intern("is optimal")
+_PH_ADJUST = sys.intern("may need adjustment")
+
+# Market demand tiers - frozensets of interned names for O(1) membership
+# with identity-level comparisons (would integrate with real market APIs)
+_HIGH_DEMAND = frozenset(map(sys.intern, ("Wheat", "Rice", "Potato", "Tomato", "Onion")))
+_MEDIUM_DEMAND = frozenset(map(sys.intern, ("Maize", "Cotton", "Sugarcane")))
+
+
+@lru_cache(maxsize=12)
+def _season_for_month(month: int) -> str:
+    """Map a calendar month to the agricultural season (memoized - the
+    answer only changes when the month does)"""
+    if month in (6, 7, 8, 9, 10):
+        return "Kharif"  # Monsoon season
+    elif month in (11, 12, 1, 2, 3):
+        return "Rabi"  # Winter season
+    else:
+        return "Summer"  # Summer season
+
+
+def _build_columns(crops: List[Dict]):
+    """Build the SoA scoring columns for a list of crop dicts"""
+    return (
+        np.array([c["ph_range"][0] for c in crops], dtype=np.float32),
+        np.array([c["ph_range"][1] for c in crops], dtype=np.float32),
+        np.array([c["temp_range"][0] for c in crops], dtype=np.float32),
+        np.array([c["temp_range"][1] for c in crops], dtype=np.float32),
+        np.array([c["nitrogen"] for c in crops], dtype=np.float32),
+        np.array([c["sustainability"] for c in crops], dtype=np.float32),
+        np.array([sum(_SEASON_BITS[s] for s in c["season"]) for c in crops],
+                 dtype=np.uint8),
+    )
+
+
+def _score_crops(ph_min, ph_max, temp_min, temp_max, nitrogen_req,
+                 sustainability, season_mask,
+                 soil_data: Dict, weather_data: Dict, season: str) -> np.ndarray:
+    """
+    The scoring kernel: one float per crop, piecewise scoring (pH 30,
+    temperature 25, season 20, nitrogen 15, sustainability 10) computed
+    with array expressions. Single implementation for both the all-crops
+    path and the single-crop wrapper.
+    """
+    score = np.zeros(len(ph_min), dtype=np.float32)
+    max_score = 100.0
+
+    # The piecewise ladders are expressed branchlessly: distance outside
+    # the [min, max] band is 0 inside it, and the tier contributions stack
+    # (in-band hits every tier), so comparisons become straight-line
+    # arithmetic with no np.where selects
+    ph = soil_data.get("ph")
+    if ph:
+        d = np.maximum(0.0, np.maximum(ph_min - ph, ph - ph_max))
+        score += 10 * (d <= 1.0) + 10 * (d <= 0.5) + 10 * (d <= 0.0)
+
+    temp = weather_data.get("temperature")
+    if temp:
+        d = np.maximum(0.0, np.maximum(temp_min - temp, temp - temp_max))
+        score += 8 * (d <= 5.0) + 7 * (d <= 3.0) + 10 * (d <= 0.0)
+
+    season_bit = _SEASON_BITS.get(season, 0)
+    score += 20 * ((season_mask & season_bit) != 0)
+
+    # SoilGrids reports nitrogen as high/medium/low - only numeric
+    # values can be compared against crop requirements
+    nitrogen = soil_data.get("nitrogen")
+    if isinstance(nitrogen, (int, float)) and nitrogen:
+        score += (5 * (nitrogen >= nitrogen_req * 0.6)
+                  + 5 * (nitrogen >= nitrogen_req * 0.8)
+                  + 5 * (nitrogen >= nitrogen_req))
+
+    score += sustainability
+
+    return score / max_score
+
+# Crop database with requirements - built once at import and shared by
+# every instance (and across forked workers via copy-on-write)
+CROP_DATABASE = {
+    "Rice": {
+        "ph_range": (5.5, 7.0),
+        "temp_range": (20, 35),
+        "water": "High",
+        "duration": 120,
+        "season": ["Kharif", "Rabi"],
+        "nitrogen": 120,
+        "profit_per_hectare": 45000,
+        "yield_per_hectare": 4.0,
+        "sustainability": 7.0
+    },
+    "Wheat": {
+        "ph_range": (6.0, 7.5),
+        "temp_range": (15, 25),
+        "water": "Medium",
+        "duration": 120,
+        "season": ["Rabi"],
+        "nitrogen": 100,
+        "profit_per_hectare": 65000,
+        "yield_per_hectare": 4.5,
+        "sustainability": 8.5
+    },
+    "Sugarcane": {
+        "ph_range": (6.0, 7.5),
+        "temp_range": (25, 35),
+        "water": "High",
+        "duration": 365,
+        "season": ["Year-round"],
+        "nitrogen": 200,
+        "profit_per_hectare": 120000,
+        "yield_per_hectare": 70.0,
+        "sustainability": 6.0
+    },
+    "Cotton": {
+        "ph_range": (6.0, 8.0),
+        "temp_range": (21, 30),
+        "water": "Medium",
+        "duration": 180,
+        "season": ["Kharif"],
+        "nitrogen": 120,
+        "profit_per_hectare": 55000,
+        "yield_per_hectare": 2.5,
+        "sustainability": 6.5
+    },
+    "Maize": {
+        "ph_range": (5.5, 7.0),
+        "temp_range": (20, 30),
+        "water": "Medium",
+        "duration": 90,
+        "season": ["Kharif", "Rabi"],
+        "nitrogen": 150,
+        "profit_per_hectare": 40000,
+        "yield_per_hectare": 3.5,
+        "sustainability": 8.0
+    },
+    "Groundnut": {
+        "ph_range": (6.0, 7.0),
+        "temp_range": (25, 30),
+        "water": "Low",
+        "duration": 120,
+        "season": ["Kharif"],
+        "nitrogen": 25,
+        "profit_per_hectare": 50000,
+        "yield_per_hectare": 2.0,
+        "sustainability": 9.0
+    },
+    "Pulses": {
+        "ph_range": (6.0, 7.5),
+        "temp_range": (20, 30),
+        "water": "Low",
+        "duration": 90,
+        "season": ["Rabi"],
+        "nitrogen": 20,
+        "profit_per_hectare": 35000,
+        "yield_per_hectare": 1.5,
+        "sustainability": 9.5
+    },
+    "Potato": {
+        "ph_range": (5.0, 6.5),
+        "temp_range": (15, 25),
+        "water": "Medium",
+        "duration": 90,
+        "season": ["Rabi"],
+        "nitrogen": 120,
+        "profit_per_hectare": 80000,
+        "yield_per_hectare": 25.0,
+        "sustainability": 7.5
+    },
+    "Tomato": {
+        "ph_range": (6.0, 7.0),
+        "temp_range": (18, 27),
+        "water": "Medium",
+        "duration": 120,
+        "season": ["Rabi", "Summer"],
+        "nitrogen": 100,
+        "profit_per_hectare": 90000,
+        "yield_per_hectare": 30.0,
+        "sustainability": 7.0
+    },
+    "Onion": {
+        "ph_range": (6.0, 7.0),
+        "temp_range": (20, 30),
+        "water": "Medium",
+        "duration": 120,
+        "season": ["Kharif", "Rabi"],
+        "nitrogen": 100,
+        "profit_per_hectare": 70000,
+        "yield_per_hectare": 20.0,
+        "sustainability": 7.5
+    }
+}
+
+# Intern the repeated literal strings (seasons, water levels) so equal
+# values share one object and membership checks short-circuit on identity
+for _data in CROP_DATABASE.values():
+    _data["season"] = [sys.intern(s) for s in _data["season"]]
+    _data["water"] = sys.intern(_data["water"])
+del _data
+
+
 class CropRecommenderService:
     def __init__(self):
-        # Crop database with requirements
-        self.crop_database = {
-            "Rice": {
-                "ph_range": (5.5, 7.0),
-                "temp_range": (20, 35),
-                "water": "High",
-                "duration": 120,
-                "season": ["Kharif", "Rabi"],
-                "nitrogen": 120,
-                "profit_per_hectare": 45000,
-                "yield_per_hectare": 4.0,
-                "sustainability": 7.0
-            },
-            "Wheat": {
-                "ph_range": (6.0, 7.5),
-                "temp_range": (15, 25),
-                "water": "Medium",
-                "duration": 120,
-                "season": ["Rabi"],
-                "nitrogen": 100,
-                "profit_per_hectare": 65000,
-                "yield_per_hectare": 4.5,
-                "sustainability": 8.5
-            },
-            "Sugarcane": {
-                "ph_range": (6.0, 7.5),
-                "temp_range": (25, 35),
-                "water": "High",
-                "duration": 365,
-                "season": ["Year-round"],
-                "nitrogen": 200,
-                "profit_per_hectare": 120000,
-                "yield_per_hectare": 70.0,
-                "sustainability": 6.0
-            },
-            "Cotton": {
-                "ph_range": (6.0, 8.0),
-                "temp_range": (21, 30),
-                "water": "Medium",
-                "duration": 180,
-                "season": ["Kharif"],
-                "nitrogen": 120,
-                "profit_per_hectare": 55000,
-                "yield_per_hectare": 2.5,
-                "sustainability": 6.5
-            },
-            "Maize": {
-                "ph_range": (5.5, 7.0),
-                "temp_range": (20, 30),
-                "water": "Medium",
-                "duration": 90,
-                "season": ["Kharif", "Rabi"],
-                "nitrogen": 150,
-                "profit_per_hectare": 40000,
-                "yield_per_hectare": 3.5,
-                "sustainability": 8.0
-            },
-            "Groundnut": {
-                "ph_range": (6.0, 7.0),
-                "temp_range": (25, 30),
-                "water": "Low",
-                "duration": 120,
-                "season": ["Kharif"],
-                "nitrogen": 25,
-                "profit_per_hectare": 50000,
-                "yield_per_hectare": 2.0,
-                "sustainability": 9.0
-            },
-            "Pulses": {
-                "ph_range": (6.0, 7.5),
-                "temp_range": (20, 30),
-                "water": "Low",
-                "duration": 90,
-                "season": ["Rabi"],
-                "nitrogen": 20,
-                "profit_per_hectare": 35000,
-                "yield_per_hectare": 1.5,
-                "sustainability": 9.5
-            },
-            "Potato": {
-                "ph_range": (5.0, 6.5),
-                "temp_range": (15, 25),
-                "water": "Medium",
-                "duration": 90,
-                "season": ["Rabi"],
-                "nitrogen": 120,
-                "profit_per_hectare": 80000,
-                "yield_per_hectare": 25.0,
-                "sustainability": 7.5
-            },
-            "Tomato": {
-                "ph_range": (6.0, 7.0),
-                "temp_range": (18, 27),
-                "water": "Medium",
-                "duration": 120,
-                "season": ["Rabi", "Summer"],
-                "nitrogen": 100,
-                "profit_per_hectare": 90000,
-                "yield_per_hectare": 30.0,
-                "sustainability": 7.0
-            },
-            "Onion": {
-                "ph_range": (6.0, 7.0),
-                "temp_range": (20, 30),
-                "water": "Medium",
-                "duration": 120,
-                "season": ["Kharif", "Rabi"],
-                "nitrogen": 100,
-                "profit_per_hectare": 70000,
-                "yield_per_hectare": 20.0,
-                "sustainability": 7.5
-            }
+        # Shared module-level table - instances only hold a reference
+        self.crop_database = CROP_DATABASE
+
+        self._build_score_arrays()
+
+    def _build_score_arrays(self):
+        """
+        Mirror the crop database into structure-of-arrays NumPy columns so
+        scoring evaluates every crop at once instead of looping Python
+        branches per crop. The dict above stays the source of truth and is
+        still used for reasoning strings and response fields.
+        """
+        self._crop_names = list(self.crop_database)
+        self._columns = _build_columns(list(self.crop_database.values()))
+
+        # Water requirement and profit never change at runtime - format
+        # that part of each crop's reasoning string once
+        self._reasoning_suffix = {
+            name: f"{data['water']} water requirement. "
+                  f"Expected profit: ₹{data['profit_per_hectare']:,}/hectare."
+            for name, data in self.crop_database.items()
         }
-    
+
+    def _score_all(self, soil_data: Dict, weather_data: Dict, season: str) -> np.ndarray:
+        """Score every crop at once via the shared kernel"""
+        return _score_crops(*self._columns, soil_data, weather_data, season)
+
     def get_current_season(self) -> str:
         """Determine current agricultural season"""
-        month = datetime.now().month
-        
-        if month in [6, 7, 8, 9, 10]:
-            return "Kharif"  # Monsoon season
-        elif month in [11, 12, 1, 2, 3]:
-            return "Rabi"  # Winter season
-        else:
-            return "Summer"  # Summer season
+        return _season_for_month(datetime.now().month)
     
-    def calculate_crop_score(self, crop_data: Dict, soil_data: Dict, 
+    def calculate_crop_score(self, crop_data: Dict, soil_data: Dict,
                             weather_data: Dict, season: str) -> float:
-        """Calculate suitability score for a crop"""
-        score = 0
-        max_score = 0
-        
-        # pH suitability (30 points)
-        max_score += 30
-        if soil_data.get("ph"):
-            ph = soil_data["ph"]
-            ph_min, ph_max = crop_data["ph_range"]
-            if ph_min <= ph <= ph_max:
-                score += 30
-            elif abs(ph - ph_min) <= 0.5 or abs(ph - ph_max) <= 0.5:
-                score += 20
-            elif abs(ph - ph_min) <= 1.0 or abs(ph - ph_max) <= 1.0:
-                score += 10
-        
-        # Temperature suitability (25 points)
-        max_score += 25
-        if weather_data.get("temperature"):
-            temp = weather_data["temperature"]
-            temp_min, temp_max = crop_data["temp_range"]
-            if temp_min <= temp <= temp_max:
-                score += 25
-            elif abs(temp - temp_min) <= 3 or abs(temp - temp_max) <= 3:
-                score += 15
-            elif abs(temp - temp_min) <= 5 or abs(temp - temp_max) <= 5:
-                score += 8
-        
-        # Season match (20 points)
-        max_score += 20
-        if season in crop_data["season"]:
-            score += 20
-        
-        # Nitrogen availability (15 points)
-        max_score += 15
-        if soil_data.get("nitrogen"):
-            nitrogen = soil_data["nitrogen"]
-            required = crop_data["nitrogen"]
-            if nitrogen >= required:
-                score += 15
-            elif nitrogen >= required * 0.8:
-                score += 10
-            elif nitrogen >= required * 0.6:
-                score += 5
-        
-        # Sustainability bonus (10 points)
-        max_score += 10
-        score += crop_data["sustainability"]
-        
-        return (score / max_score) if max_score > 0 else 0
+        """
+        Calculate suitability score for a single crop - thin wrapper that
+        stages the crop as one-row columns for the shared kernel, so
+        scoring logic lives in exactly one place
+        """
+        columns = _build_columns([crop_data])
+        return float(_score_crops(*columns, soil_data, weather_data, season)[0])
     
     def generate_reasoning(self, crop_name: str, crop_data: Dict, 
                           soil_data: Dict, weather_data: Dict, 
                           score: float, season: str) -> str:
         """Generate human-readable reasoning for recommendation"""
         reasons = []
-        
+
         # Season match
         if season in crop_data["season"]:
             reasons.append(f"Current {season} season is ideal for {crop_name}")
-        
+
         # pH suitability
-        if soil_data.get("ph"):
-            ph = soil_data["ph"]
+        ph = soil_data.get("ph")
+        if ph:
             ph_min, ph_max = crop_data["ph_range"]
-            if ph_min <= ph <= ph_max:
-                reasons.append(f"Soil pH ({ph:.1f}) is optimal")
-            else:
-                reasons.append(f"Soil pH ({ph:.1f}) may need adjustment")
-        
+            verdict = _PH_OPTIMAL if ph_min <= ph <= ph_max else _PH_ADJUST
+            reasons.append(f"Soil pH ({ph:.1f}) {verdict}")
+
         # Temperature
-        if weather_data.get("temperature"):
-            temp = weather_data["temperature"]
+        temp = weather_data.get("temperature")
+        if temp:
             temp_min, temp_max = crop_data["temp_range"]
             if temp_min <= temp <= temp_max:
                 reasons.append(f"Temperature ({temp}°C) is favorable")
-        
-        # Water requirement
-        reasons.append(f"{crop_data['water']} water requirement")
-        
-        # Profitability
-        profit = crop_data["profit_per_hectare"]
-        reasons.append(f"Expected profit: ₹{profit:,}/hectare")
-        
-        return ". ".join(reasons) + "."
+
+        # Water requirement and profit are preformatted per crop
+        suffix = self._reasoning_suffix[crop_name]
+        if reasons:
+            return f"{'. '.join(reasons)}. {suffix}"
+        return suffix
     
     def get_market_demand(self, crop_name: str) -> str:
         """Get market demand status (would integrate with real market APIs)"""
-        # High demand crops
-        high_demand = ["Wheat", "Rice", "Potato", "Tomato", "Onion"]
-        medium_demand = ["Maize", "Cotton", "Sugarcane"]
-        
-        if crop_name in high_demand:
+        if crop_name in _HIGH_DEMAND:
             return "High"
-        elif crop_name in medium_demand:
+        elif crop_name in _MEDIUM_DEMAND:
             return "Medium"
         else:
             return "Low"
     
-    def recommend_crops(self, soil_data: Dict, weather_data: Dict, 
-                       season: str = None) -> List[CropRecommendation]:
+    def recommend_crops(self, soil_data: Dict, weather_data: Dict,
+                       season: str = None,
+                       district: str = None) -> List[CropRecommendation]:
         """Generate crop recommendations based on conditions"""
         
         if not season:
             season = self.get_current_season()
-        
+
+        # Bucket the numeric drivers (0.1 pH, 1°C, 10 kg nitrogen) so the
+        # near-identical soil/weather vectors of neighbouring farmers share
+        # one cached result
+        ph = soil_data.get("ph")
+        temp = weather_data.get("temperature")
+        nitrogen = soil_data.get("nitrogen")
+        ph_b = round(ph, 1) if isinstance(ph, (int, float)) else None
+        temp_b = round(temp) if isinstance(temp, (int, float)) else None
+        n_b = round(nitrogen / 10) * 10 if isinstance(nitrogen, (int, float)) else None
+
+        # Persistent tier first: a district's conditions are stable for
+        # weeks, so most calls resolve to one cache read across restarts
+        if _DISK_CACHE is not None:
+            key = (district, season, ph_b, temp_b, n_b)
+            cached = _DISK_CACHE.get(key)
+            if cached is not None:
+                return list(cached)
+
+        result = self._recommend_cached(ph_b, temp_b, n_b, season)
+
+        if _DISK_CACHE is not None:
+            _DISK_CACHE.set(key, result, expire=DISK_CACHE_TTL_SECONDS)
+
+        return list(result)
+
+    @lru_cache(maxsize=4096)
+    def _recommend_cached(self, ph_b, temp_b, n_b, season: str):
+        """
+        The deterministic core of recommend_crops over bucketed inputs.
+        Scores every crop in one vectorized pass and builds response
+        objects only for the winners; reasoning strings use the bucketed
+        values. Returns a tuple so the cached value stays immutable.
+        """
+        soil_data = {}
+        if ph_b is not None:
+            soil_data["ph"] = ph_b
+        if n_b is not None:
+            soil_data["nitrogen"] = n_b
+        weather_data = {"temperature": temp_b} if temp_b is not None else {}
+
+        scores = self._score_all(soil_data, weather_data, season)
+
+        # Partial selection: argpartition finds the top K in O(N), then
+        # only those K are sorted - a full argsort is wasted work once the
+        # crop table grows
+        k = min(5, scores.size)
+        top = np.argpartition(scores, -k)[-k:]
+        order = top[np.argsort(scores[top])[::-1]]
+
         recommendations = []
-        
-        for crop_name, crop_data in self.crop_database.items():
-            # Calculate suitability score
-            score = self.calculate_crop_score(crop_data, soil_data, weather_data, season)
-            
-            # Only recommend crops with decent scores
-            if score >= 0.5:
-                reasoning = self.generate_reasoning(
-                    crop_name, crop_data, soil_data, weather_data, score, season
-                )
-                
-                recommendation = CropRecommendation(
-                    crop_name=crop_name,
-                    confidence_score=round(score, 2),
-                    expected_yield=crop_data["yield_per_hectare"],
-                    estimated_profit=crop_data["profit_per_hectare"],
-                    sustainability_score=crop_data["sustainability"],
-                    water_requirement=crop_data["water"],
-                    duration_days=crop_data["duration"],
-                    market_demand=self.get_market_demand(crop_name),
-                    reasoning=reasoning
-                )
-                
-                recommendations.append(recommendation)
-        
-        # Sort by confidence score
-        recommendations.sort(key=lambda x: x.confidence_score, reverse=True)
-        
-        # Return top 5 recommendations
-        return recommendations[:5]
+        for idx in order:
+            score = float(scores[idx])
+
+            # Only recommend crops with decent scores (sorted descending,
+            # so the rest are below threshold too)
+            if score < 0.5:
+                break
+
+            crop_name = self._crop_names[idx]
+            crop_data = self.crop_database[crop_name]
+            reasoning = self.generate_reasoning(
+                crop_name, crop_data, soil_data, weather_data, score, season
+            )
+
+            recommendations.append(CropRecommendation(
+                crop_name=crop_name,
+                confidence_score=round(score, 2),
+                expected_yield=crop_data["yield_per_hectare"],
+                estimated_profit=crop_data["profit_per_hectare"],
+                sustainability_score=crop_data["sustainability"],
+                water_requirement=crop_data["water"],
+                duration_days=crop_data["duration"],
+                market_demand=self.get_market_demand(crop_name),
+                reasoning=reasoning
+            ))
+
+        return tuple(recommendations)
 
 # Singleton instance
 recommender_service = CropRecommenderService()
\ No newline at end of file
@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Answers stay useful for an hour - prices and weather advice go stale,
+# crop/disease answers mostly don't, so this is a conservative middle ground
+CACHE_TTL_SECONDS = 3600
+CACHE_MAXSIZE = 512
+
+# Cosine similarity floor for treating two questions as the same question
+SIMILARITY_THRESHOLD = 0.92
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase and collapse whitespace so trivial variants share a key"""
+    return " ".join(message.lower().split())
+
+
+class SemanticCache:
+    """
+    Two-tier cache for assistant answers.
+
+    Tier 1 is an exact dict lookup on a hash of the normalized question
+    plus a context signature (language and the farmer-context fields that
+    shape the prompt) and season. Tier 2 catches paraphrases: a unit-norm
+    embedding matrix of recent questions is scanned with one matmul and
+    the best match is returned when its cosine similarity clears the
+    threshold and the context signature matches - personalized answers
+    are never served across farmers with different contexts. Either hit
+    skips the Gemini call.
+    """
+
+    def __init__(self, ttl: int = CACHE_TTL_SECONDS, maxsize: int = CACHE_MAXSIZE,
+                 threshold: float = SIMILARITY_THRESHOLD):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._exact: Dict[bytes, dict] = {}
+        self._entries: deque = deque()  # insertion order drives TTL eviction
+        self._matrix: Optional[np.ndarray] = None  # (N, D) unit-norm rows
+
+    @staticmethod
+    def exact_key(normalized: str, context: str, season: str) -> bytes:
+        return hashlib.blake2b(
+            f"{normalized}|{context}|{season}".encode(), digest_size=16
+        ).digest()
+
+    def get_exact(self, key: bytes) -> Optional[dict]:
+        entry = self._exact.get(key)
+        if entry and entry["expires_at"] > time.monotonic():
+            return entry["response"]
+        return None
+
+    def get_similar(self, embedding: List[float], context: str) -> Optional[dict]:
+        """Return the best stored answer whose question embeds close enough"""
+        self._evict_expired()
+        if self._matrix is None or not len(self._entries):
+            return None
+
+        # Only entries generated under the same context signature are
+        # eligible - a personalized answer must never cross contexts
+        eligible = np.fromiter(
+            (entry["context"] == context for entry in self._entries),
+            dtype=bool, count=len(self._entries)
+        )
+        if not eligible.any():
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+
+        # Rows are unit-norm, so one matvec gives every cosine similarity
+        scores = np.where(eligible, self._matrix @ query, -1.0)
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            logger.info("Semantic cache hit (similarity %.3f)", float(scores[best]))
+            return self._entries[best]["response"]
+        return None
+
+    def put(self, key: bytes, embedding: List[float], context: str, response: dict):
+        if len(self._entries) >= self.maxsize:
+            self._pop_oldest()
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        entry = {
+            "key": key,
+            "embedding": vector,
+            "context": context,
+            "response": response,
+            "expires_at": time.monotonic() + self.ttl
+        }
+        self._entries.append(entry)
+        self._exact[key] = entry
+        self._rebuild_matrix()
+
+    def _pop_oldest(self):
+        entry = self._entries.popleft()
+        self._exact.pop(entry["key"], None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        evicted = False
+        while self._entries and self._entries[0]["expires_at"] <= now:
+            self._pop_oldest()
+            evicted = True
+        if evicted:
+            self._rebuild_matrix()
+
+    def _rebuild_matrix(self):
+        # A few hundred small vectors - restacking is cheap and keeps row
+        # order exactly aligned with the deque
+        if self._entries:
+            self._matrix = np.stack([e["embedding"] for e in self._entries])
+        else:
+            self._matrix = None
+
+    def save(self, path: str):
+        """Persist unexpired entries so a restart keeps the warm cache"""
+        try:
+            now = time.monotonic()
+            payload = [
+                {
+                    "key": entry["key"].hex(),
+                    "embedding": entry["embedding"].tolist(),
+                    "context": entry["context"],
+                    "response": entry["response"],
+                    "ttl_left": entry["expires_at"] - now
+                }
+                for entry in self._entries
+                if entry["expires_at"] > now
+            ]
+            with open(path, "wb") as f:
+                f.write(orjson.dumps(payload))
+            logger.info("Semantic cache saved: %s entries", len(payload))
+        except Exception as e:
+            logger.error("Failed to save semantic cache: %s", str(e))
+
+    def load(self, path: str):
+        """Restore a previously saved cache (missing file is fine)"""
+        try:
+            with open(path, "rb") as f:
+                payload = orjson.loads(f.read())
+            for item in payload:
+                if item["ttl_left"] <= 0:
+                    continue
+                key = bytes.fromhex(item["key"])
+                vector = np.asarray(item["embedding"], dtype=np.float32)
+                entry = {
+                    "key": key,
+                    "embedding": vector,
+                    "context": item["context"],
+                    "response": item["response"],
+                    "expires_at": time.monotonic() + item["ttl_left"]
+                }
+                self._entries.append(entry)
+                self._exact[key] = entry
+            self._rebuild_matrix()
+            logger.info("Semantic cache loaded: %s entries", len(self._entries))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error("Failed to load semantic cache: %s", str(e))